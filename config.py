@@ -13,6 +13,41 @@ Args:
     PG_PASS: Пароль базы данных
     PG_HOST: Хост базы данных
     PG_NAME: Название базы данных
+    DB_ECHO: Вывод SQL-запросов в лог (по умолчанию выключен)
+    DB_POOL_SIZE: Количество постоянных соединений в пуле
+    DB_MAX_OVERFLOW: Количество дополнительных соединений сверх пула
+    DB_POOL_TIMEOUT: Время ожидания свободного соединения (сек.)
+    DB_POOL_PRE_PING: Проверка соединения перед выдачей из пула
+    DB_POOL_RECYCLE: Время жизни соединения (сек.), -1 - без ограничения
+    DB_STATEMENT_CACHE_SIZE: Размер кэша подготовленных запросов asyncpg
+    CATALOG_CACHE_TTL: Время жизни кэша каталога (сек.)
+    KNOWN_USERS_MAX_SIZE: Максимум известных пользователей в памяти
+    PAYMENT_CACHE_TTL: Время жизни незавершённого статуса платежа (сек.)
+    PAYMENT_CACHE_MAX_SIZE: Максимум статусов платежей в памяти
+    CODE_POOL_BATCH_SIZE: Сколько кодов резервируется за один запрос
+    CODE_POOL_LOW_WATERMARK: Остаток кодов в буфере, при котором
+        начинается фоновое пополнение
+    FSM_STORAGE: Хранилище машины состояний: memory или postgres
+    FSM_STATE_TTL: Время жизни состояния пользователя (сек.)
+    FSM_FLUSH_INTERVAL: Период записи состояний в БД (сек.), 0 - сразу
+    BOT_MODE: Способ получения обновлений: polling или webhook
+    WEBHOOK_URL: Внешний адрес бота, например https://bot.example.com
+    WEBHOOK_PATH: Путь, на который Telegram присылает обновления
+    WEBHOOK_SECRET: Секретный токен, которым Telegram подписывает запросы
+    WEBAPP_HOST: Адрес, на котором слушает веб-сервер
+    WEBAPP_PORT: Порт веб-сервера
+    WEBHOOK_MAX_CONNECTIONS: Максимум одновременных соединений от Telegram
+    WEBHOOK_CONCURRENCY: Максимум одновременно обрабатываемых обновлений
+    WORKERS: Количество процессов-воркеров, 0 - всё в одном процессе
+    WORKER_CONCURRENCY: Максимум одновременных обновлений в воркере
+    YOOKASSA_TIMEOUT: Таймаут запроса к yookassa (сек.)
+    YOOKASSA_RETRIES: Количество повторов запроса к yookassa
+    YOOKASSA_NOTIFICATIONS: Приём HTTP-уведомлений yookassa о платежах
+    YOOKASSA_WEBHOOK_PATH: Путь, на который yookassa присылает уведомления
+    YOOKASSA_TRUST_FORWARDED: Брать IP отправителя из X-Forwarded-For
+    PAYMENT_RECONCILE_INTERVAL: Период сверки неоплаченных заказов (сек.),
+        0 - сверка выключена
+    PAYMENT_RECONCILE_WINDOW: Сколько секунд заказ ждёт оплаты
 """
 import os
 from dotenv import load_dotenv
@@ -30,7 +65,54 @@ PG_PASS = os.environ.get("PG_PASS")
 PG_HOST = os.environ.get("PG_HOST")
 PG_NAME = os.environ.get("PG_NAME")
 
+# Параметры пула соединений с БД
+DB_ECHO = os.environ.get("DB_ECHO", "false").lower() == "true"
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 10))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", 20))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 30))
+DB_POOL_PRE_PING = os.environ.get("DB_POOL_PRE_PING", "true").lower() == "true"
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", 1800))
+DB_STATEMENT_CACHE_SIZE = int(os.environ.get("DB_STATEMENT_CACHE_SIZE", 100))
+
+# Кэширование
+CATALOG_CACHE_TTL = float(os.environ.get("CATALOG_CACHE_TTL", 300))
+KNOWN_USERS_MAX_SIZE = int(os.environ.get("KNOWN_USERS_MAX_SIZE", 100_000))
+PAYMENT_CACHE_TTL = float(os.environ.get("PAYMENT_CACHE_TTL", 5))
+PAYMENT_CACHE_MAX_SIZE = int(os.environ.get("PAYMENT_CACHE_MAX_SIZE", 10_000))
+CODE_POOL_BATCH_SIZE = int(os.environ.get("CODE_POOL_BATCH_SIZE", 500))
+CODE_POOL_LOW_WATERMARK = int(os.environ.get("CODE_POOL_LOW_WATERMARK", 100))
+
+# Хранилище машины состояний
+FSM_STORAGE = os.environ.get("FSM_STORAGE", "memory")
+FSM_STATE_TTL = int(os.environ.get("FSM_STATE_TTL", 86400))
+FSM_FLUSH_INTERVAL = float(os.environ.get("FSM_FLUSH_INTERVAL", 1))
+
+# Режим получения обновлений
+BOT_MODE = os.environ.get("BOT_MODE", "polling")
+WEBHOOK_URL = os.environ.get("WEBHOOK_URL", "")
+WEBHOOK_PATH = os.environ.get("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.environ.get("WEBHOOK_SECRET")
+WEBAPP_HOST = os.environ.get("WEBAPP_HOST", "0.0.0.0")
+WEBAPP_PORT = int(os.environ.get("WEBAPP_PORT", 8080))
+WEBHOOK_MAX_CONNECTIONS = int(os.environ.get("WEBHOOK_MAX_CONNECTIONS", 40))
+WEBHOOK_CONCURRENCY = int(os.environ.get("WEBHOOK_CONCURRENCY", 100))
+
+# Многопроцессная обработка обновлений
+WORKERS = int(os.environ.get("WORKERS", 0))
+WORKER_CONCURRENCY = int(os.environ.get("WORKER_CONCURRENCY", 50))
+
 # Подключение платежной системы
 YOOKASSA_SECRET_KEY = os.environ.get("YOOKASSA_SECRET_KEY")
 YOOKASSA_ACCIUNT_ID = os.environ.get("YOOKASSA_ACCIUNT_ID")
 YOOKASSA_TOKEN = os.environ.get("YOOKASSA_TOKEN")
+YOOKASSA_TIMEOUT = float(os.environ.get("YOOKASSA_TIMEOUT", 10))
+YOOKASSA_RETRIES = int(os.environ.get("YOOKASSA_RETRIES", 3))
+YOOKASSA_NOTIFICATIONS = os.environ.get(
+    "YOOKASSA_NOTIFICATIONS", "false").lower() == "true"
+YOOKASSA_WEBHOOK_PATH = os.environ.get("YOOKASSA_WEBHOOK_PATH", "/yookassa")
+YOOKASSA_TRUST_FORWARDED = os.environ.get(
+    "YOOKASSA_TRUST_FORWARDED", "false").lower() == "true"
+PAYMENT_RECONCILE_INTERVAL = float(
+    os.environ.get("PAYMENT_RECONCILE_INTERVAL", 60))
+PAYMENT_RECONCILE_WINDOW = int(
+    os.environ.get("PAYMENT_RECONCILE_WINDOW", 86400))
@@ -21,6 +21,8 @@ user_menu = {
     11: "🎁МОИ ТОВАРЫ🎁",
     12: "💳ОПЛАТИТЬ КАРТОЙ💳",
     13: "💵ПОПОЛНИТЬ БАЛАНС💵",
+    14: "◀️",
+    15: "▶️",
 }
 
 admin_menu = {
@@ -33,6 +35,7 @@ admin_menu = {
     7: "😈МЕНЮ😈",
     8: "👈НАЗАД👈",
     9: "😎ВАШ ТЕЛЕГРАММ ID😎",
+    10: "📦ЗАГРУЗИТЬ КОДЫ📦",
 }
 
 fsm_product = {
@@ -51,6 +54,11 @@ fsm_product = {
     13: "Введите ID состоящее только из цифр!",
     14: "Введите дробное число в формате 00.00 !",
     15: "Цена должна быть в диапазоне от -99999999.99 до 99999999.99.",
+    16: "Укажите ID товара (есть в карточке товара в каталоге)...",
+    17: "Отправьте коды товара, каждый с новой строки...",
+    18: "Товар с таким ID не найден!",
+    19: "Сумма платежа должна быть от 0.01 до 99999999.99 !",
+    20: "Не удалось создать платёж, попробуйте позже!",
 }
 
 bot_status = {
@@ -0,0 +1,252 @@
+"""
+Кэши слоя данных в памяти процесса.
+
+Classes:
+    CatalogCache: Кэш каталога товаров
+    KnownUsers: Ограниченное множество известных пользователей
+    PaymentCache: Кэш статусов платежей yookassa
+
+Args:
+    catalog_cache: Общий кэш каталога процесса
+    known_users: Известные процессу пользователи
+    payment_cache: Статусы платежей, полученные процессом
+"""
+import sys
+import time
+from bisect import bisect_left, bisect_right, insort
+from collections import OrderedDict
+from typing import Any, Iterable
+
+from config import (CATALOG_CACHE_TTL, KNOWN_USERS_MAX_SIZE,
+                    PAYMENT_CACHE_TTL, PAYMENT_CACHE_MAX_SIZE)
+
+
+class CatalogCache:
+    """
+    Кэш каталога товаров с TTL и сквозной инвалидацией.
+
+    Notes:
+
+        Функции записи в каталог обновляют или сбрасывают кэш
+        сразу, а TTL страхует от изменений, сделанных в базе
+        в обход бота (другим процессом или вручную).
+    """
+
+    def __init__(self, ttl: float):
+        """Метод инициализации класса."""
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.version = 0
+        self._items: dict[int, dict[str, Any]] | None = None
+        self._ids: list[int] = []
+        self._loaded_at = 0.0
+
+    def _is_fresh(self) -> bool:
+        """Кэш заполнен и TTL не истёк."""
+        return (self._items is not None and
+                time.monotonic() - self._loaded_at < self.ttl)
+
+    def get(self) -> list[dict[str, Any]] | None:
+        """
+        Получение каталога из кэша.
+
+        Returns:
+            Возвращает список товаров, отсортированный по ID,
+            или None, если кэш пуст или устарел.
+        """
+        if self._is_fresh():
+            self.hits += 1
+            return list(self._items.values())
+        self.misses += 1
+        return None
+
+    def page(self, cursor: int, limit: int,
+             backward: bool = False
+             ) -> tuple[list[dict[str, Any]], bool, bool] | None:
+        """
+        Страница каталога по курсору из кэша.
+
+        Args:
+            cursor: ID товара, от которого считается страница
+            limit: Количество товаров на странице
+            backward: Листать назад (товары с ID меньше курсора)
+
+        Returns:
+            Возвращает (товары, есть_предыдущая, есть_следующая)
+            или None, если кэш пуст или устарел.
+        """
+        if not self._is_fresh():
+            self.misses += 1
+            return None
+        self.hits += 1
+        if backward:
+            end = bisect_left(self._ids, cursor)
+            start = max(0, end - limit)
+        else:
+            start = bisect_right(self._ids, cursor)
+            end = start + limit
+        ids = self._ids[start:end]
+        return ([self._items[item_id] for item_id in ids],
+                start > 0, end < len(self._ids))
+
+    def fill(self, products: list[dict[str, Any]]) -> None:
+        """Заполнение кэша списком товаров из базы."""
+        self._items = {item["id"]: item
+                       for item in sorted(products, key=lambda p: p["id"])}
+        self._ids = list(self._items)
+        self._loaded_at = time.monotonic()
+        self.version += 1
+
+    def add(self, item: dict[str, Any]) -> None:
+        """Добавление нового товара в заполненный кэш."""
+        if self._items is None:
+            return
+        if item["id"] not in self._items:
+            insort(self._ids, item["id"])
+        self._items[item["id"]] = item
+        if self._ids[-1] != item["id"]:
+            self._items = {item_id: self._items[item_id]
+                           for item_id in self._ids}
+        self.version += 1
+
+    def patch(self, product_id: int, **fields: Any) -> None:
+        """Обновление полей одного товара, если он есть в кэше."""
+        if self._items is not None and product_id in self._items:
+            self._items[product_id] = {**self._items[product_id], **fields}
+            self.version += 1
+
+    def remove(self, product_id: int) -> None:
+        """Удаление товара из кэша."""
+        if self._items is not None and self._items.pop(product_id, None):
+            self._ids.remove(product_id)
+            self.version += 1
+
+    def invalidate(self) -> None:
+        """Полный сброс кэша, следующее чтение пойдёт в базу."""
+        self._items = None
+        self._ids = []
+        self.version += 1
+
+    def stats(self) -> dict[str, int | float]:
+        """Снимок счётчиков кэша."""
+        total = self.hits + self.misses
+        return {
+            "items": len(self._items) if self._items is not None else 0,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+        }
+
+
+class KnownUsers:
+    """
+    LRU-множество ID пользователей, которые уже есть в базе.
+
+    Notes:
+
+        Пользователь из базы не удаляется, поэтому попадание
+        в множество означает, что запрос к базе не нужен.
+        Промах лишь отправляет проверку в базу.
+    """
+
+    def __init__(self, max_size: int):
+        """Метод инициализации класса."""
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._ids: OrderedDict[int, None] = OrderedDict()
+
+    def __contains__(self, user_id: int) -> bool:
+        """Проверка пользователя с учётом счётчиков попаданий."""
+        if user_id in self._ids:
+            self._ids.move_to_end(user_id)
+            self.hits += 1
+            return True
+        self.misses += 1
+        return False
+
+    def add(self, user_id: int) -> None:
+        """Добавление пользователя, вытесняет самого давнего."""
+        self._ids[user_id] = None
+        self._ids.move_to_end(user_id)
+        if len(self._ids) > self.max_size:
+            self._ids.popitem(last=False)
+
+    def warm(self, user_ids: Iterable[int]) -> None:
+        """Заполнение множества при старте."""
+        for user_id in user_ids:
+            self.add(user_id)
+
+    def stats(self) -> dict[str, int | float]:
+        """Снимок размера, памяти и счётчиков попаданий."""
+        total = self.hits + self.misses
+        memory = sys.getsizeof(self._ids) + sum(
+            sys.getsizeof(user_id) for user_id in self._ids)
+        return {
+            "items": len(self._ids),
+            "max_size": self.max_size,
+            "memory_kb": round(memory / 1024, 1),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+        }
+
+
+class PaymentCache:
+    """
+    LRU-кэш статусов платежей с коротким TTL.
+
+    Notes:
+
+        Промежуточные статусы (pending, waiting_for_capture)
+        живут ttl секунд, окончательные (succeeded, canceled)
+        больше не меняются и хранятся, пока их не вытеснят
+        более свежие записи.
+    """
+
+    def __init__(self, ttl: float, max_size: int):
+        """Метод инициализации класса."""
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._items: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+
+    def get(self, payment_id: str) -> Any | None:
+        """Сохранённый статус платежа или None, если его нет или он устарел."""
+        entry = self._items.get(payment_id)
+        if entry is None or entry[0] <= time.monotonic():
+            self.misses += 1
+            return None
+        self._items.move_to_end(payment_id)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, payment_id: str, value: Any, terminal: bool) -> None:
+        """Сохранение статуса, окончательный статус хранится без TTL."""
+        expires_at = (float("inf") if terminal
+                      else time.monotonic() + self.ttl)
+        self._items[payment_id] = (expires_at, value)
+        self._items.move_to_end(payment_id)
+        if len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def stats(self) -> dict[str, int | float]:
+        """Снимок размера и счётчиков попаданий."""
+        total = self.hits + self.misses
+        return {
+            "items": len(self._items),
+            "terminal": sum(expires_at == float("inf")
+                            for expires_at, _ in self._items.values()),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+        }
+
+
+catalog_cache = CatalogCache(ttl=CATALOG_CACHE_TTL)
+known_users = KnownUsers(max_size=KNOWN_USERS_MAX_SIZE)
+payment_cache = PaymentCache(ttl=PAYMENT_CACHE_TTL,
+                             max_size=PAYMENT_CACHE_MAX_SIZE)
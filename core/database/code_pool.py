@@ -0,0 +1,141 @@
+"""
+Пулы заранее сгенерированных уникальных кодов.
+
+Classes:
+    CodePool: Буфер уникальных кодов одного вида
+
+Args:
+    gift_codes: Пул гифт-кодов
+    referral_codes: Пул реферальных кодов
+
+Func:
+    warm_code_pools: Заполнение пулов при старте
+"""
+import asyncio
+import logging
+from collections import deque
+from typing import Awaitable, Callable
+
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from config import CODE_POOL_BATCH_SIZE, CODE_POOL_LOW_WATERMARK
+from core.db_models.models import async_session, ReservedCode
+from core.tools.tool import generate_code, generate_gift
+
+
+logger = logging.getLogger(__name__)
+
+# Кодов в одном INSERT (у asyncpg не больше 32767 параметров на запрос)
+RESERVE_CHUNK = 10_000
+
+
+class CodePool:
+    """
+    Буфер уникальных кодов одного вида.
+
+    Notes:
+
+        Коды генерируются пачками через secrets и резервируются
+        в таблице reserved_codes одним INSERT ... ON CONFLICT
+        DO NOTHING RETURNING: в буфер попадают только коды,
+        которых ещё не было ни у кого. Коды выдаются из памяти,
+        а когда в буфере остаётся меньше low_watermark, пачка
+        резервируется в фоне. Сам код резервируется в запросе
+        только при пустом буфере (первое обращение после старта).
+    """
+
+    def __init__(self, kind: str, generator: Callable[[], Awaitable[str]],
+                 batch_size: int, low_watermark: int):
+        """Метод инициализации класса."""
+        self.kind = kind
+        self.generator = generator
+        self.batch_size = batch_size
+        self.low_watermark = low_watermark
+        self.reserved = 0
+        self.collisions = 0
+        self.inline_refills = 0
+        self._codes: deque[str] = deque()
+        self._refill: asyncio.Task | None = None
+
+    async def _reserve(self, count: int) -> list[str]:
+        """Генерация и резервирование count уникальных кодов."""
+        codes: list[str] = []
+        while len(codes) < count:
+            candidates = {await self.generator() for _ in range(
+                min(count - len(codes), RESERVE_CHUNK))}
+            async with async_session() as session:
+                result = await session.execute(
+                    pg_insert(ReservedCode)
+                    .values([{"code": code, "kind": self.kind}
+                             for code in candidates])
+                    .on_conflict_do_nothing()
+                    .returning(ReservedCode.code))
+                accepted = result.scalars().all()
+                await session.commit()
+            self.collisions += len(candidates) - len(accepted)
+            codes.extend(accepted)
+        self.reserved += len(codes)
+        return codes
+
+    async def refill(self) -> None:
+        """Резервирование пачки кодов в буфер."""
+        self._codes.extend(await self._reserve(self.batch_size))
+
+    async def _background_refill(self) -> None:
+        """Фоновое пополнение буфера до уровня выше low_watermark."""
+        try:
+            while len(self._codes) < self.low_watermark:
+                await self.refill()
+        except Exception as ex:
+            logger.debug(f"Ошибка пополнения пула кодов {self.kind} {ex}")
+
+    async def take(self, count: int = 1) -> list[str]:
+        """
+        Получение count уникальных кодов.
+
+        Returns:
+            Возвращает коды из буфера, при нехватке
+            резервирует недостающие в запросе.
+        """
+        # Цикл: пока идёт резервирование, буфер могут разобрать другие
+        while len(self._codes) < count:
+            self.inline_refills += 1
+            self._codes.extend(await self._reserve(
+                count - len(self._codes) + self.batch_size))
+        codes = [self._codes.popleft() for _ in range(count)]
+        if (len(self._codes) < self.low_watermark and
+                (self._refill is None or self._refill.done())):
+            self._refill = asyncio.create_task(self._background_refill())
+        return codes
+
+    async def take_one(self) -> str:
+        """Получение одного уникального кода."""
+        return (await self.take(1))[0]
+
+    def stats(self) -> dict[str, int]:
+        """Снимок размера буфера и счётчиков."""
+        return {
+            "buffered": len(self._codes),
+            "reserved": self.reserved,
+            "collisions": self.collisions,
+            "inline_refills": self.inline_refills,
+        }
+
+
+async def _referral_code() -> str:
+    """Реферальный код из 8 символов."""
+    return await generate_code(length=8)
+
+
+gift_codes = CodePool("gift", generate_gift,
+                      batch_size=CODE_POOL_BATCH_SIZE,
+                      low_watermark=CODE_POOL_LOW_WATERMARK)
+referral_codes = CodePool("referral", _referral_code,
+                          batch_size=CODE_POOL_BATCH_SIZE,
+                          low_watermark=CODE_POOL_LOW_WATERMARK)
+
+
+async def warm_code_pools() -> None:
+    """Заполнение пулов при старте, чтобы первые запросы не ждали."""
+    for pool in (gift_codes, referral_codes):
+        await pool.refill()
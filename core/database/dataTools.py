@@ -1,17 +1,36 @@
 # .scalar_one_or_none()
+import asyncio
 import logging
 from contextlib import asynccontextmanager
+from datetime import datetime
+from decimal import Decimal
 from typing import Any, AsyncGenerator
-from sqlalchemy import select
-
+from sqlalchemy import (Row, delete, exists, func,
+                        insert, literal, select, update)
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from core.database.cache import catalog_cache, known_users
 from core.db_models.models import (async_session, engine,
                                    Base, User, Product, Balance,
-                                   ShoppingCart, UserProduct)
-from core.tools.tool import generate_code
+                                   ShoppingCart, UserProduct,
+                                   Order, OrderItem, ProcessedPayment,
+                                   ProductCode)
+from core.database.code_pool import referral_codes
 
 
 logger = logging.getLogger(__name__)
 
+# Начиная с этого размера пачки товары пишутся через COPY
+COPY_THRESHOLD = 500
+
+UserProductRow = tuple[int, str, str, str]
+
+_catalog_lock = asyncio.Lock()
+_background_tasks: set[asyncio.Task] = set()
+
 
 async def create_tables() -> None:
     """Инициализация таблиц."""
@@ -32,23 +51,23 @@ async def get_session() -> AsyncGenerator[Any, Any]:
         yield session
 
 
-async def get_user(user_id: int) -> User | None:
+async def warm_known_users() -> int:
     """
-    Получение данных о пользователе из таблицы User.
-
-    Args:
-
-        user_id: ID в телеграмме
+    Прогрев множества известных пользователей при старте.
 
     Returns:
 
-        Если пользователь есть в базе, возвращает объект
-        пользователя с его данными, иначе None
+        Загружает ID пользователей из таблицы users,
+        возвращает количество загруженных ID
     """
     async with get_session() as session:
         result = await session.execute(
-            select(User).where(User.tg_id == user_id))
-        return result.scalar_one_or_none()
+            select(User.tg_id)
+            .order_by(User.tg_id.desc())
+            .limit(known_users.max_size))
+        user_ids = result.scalars().all()
+    known_users.warm(reversed(user_ids))
+    return len(user_ids)
 
 
 async def add_user(user_id: int) -> str | None:
@@ -61,27 +80,40 @@ async def add_user(user_id: int) -> str | None:
 
     Returnes:
 
-        Возвращает реферальный код в случае успеха, иначе ошибку.
-    """
+        Создаёт пользователя и его баланс одним запросом
+        INSERT ... ON CONFLICT DO NOTHING RETURNING. Реферальный
+        код берётся из пула заранее зарезервированных уникальных
+        кодов, поэтому коллизий при вставке не бывает.
+        Известные пользователи отсекаются в памяти без запроса.
+        Возвращает реферальный код нового пользователя или None,
+        если пользователь уже был зарегистрирован.
+    """
+    if user_id in known_users:
+        return None
+    new_user = (
+        pg_insert(User)
+        .values(tg_id=user_id,
+                referal_code=await referral_codes.take_one())
+        .on_conflict_do_nothing(index_elements=[User.tg_id])
+        .returning(User.tg_id, User.referal_code)
+        .cte("new_user")
+    )
+    new_balance = (
+        insert(Balance)
+        .from_select([Balance.user_id, Balance.quantity],
+                     select(new_user.c.tg_id, literal(0)))
+        .cte("new_balance")
+    )
     async with get_session() as session:
-        ref_code = await generate_code(length=8)
-        user = User(tg_id=user_id, referal_code=ref_code)
-        balance = Balance(user_id=user_id, quantity=0.0)
-        if (
-            isinstance(user, User) and
-            user.tg_id and user.referal_code
-        ):
-            session.add_all([user, balance])
-            await session.commit()
-            return ref_code
-        else:
-            logger.debug(
-                "Проблема с добавлением пользователя или генерацией реф кода")
-            return "Ошибка нового пользователя!"
+        ref_code = await session.scalar(
+            select(new_user.c.referal_code).add_cte(new_balance))
+        await session.commit()
+    known_users.add(user_id)
+    return ref_code
 
 
 async def add_product(name: str, description: str,
-                      price: float, photo_id: str) -> str:
+                      price: Decimal, photo_id: str) -> int | None:
     """
     Добавление продукта в базу данных.
 
@@ -94,50 +126,25 @@ async def add_product(name: str, description: str,
 
     Returnes:
 
-        Добавляет продукт в базу данных, возвращает строку с оповещением
-    """
-    async with get_session() as session:
-        product = Product(product_name=name, description=description,
-                          price=price, is_stock=True, photo_id=photo_id)
-        if (
-            isinstance(product, Product) and
-            product.product_name and product.description and
-            product.price and product.is_stock and product.photo_id
-        ):
-
-            session.add(product)
-            await session.commit()
-            return "Продукт добавлен!"
-        else:
-            logger.debug(
-                "Проблема с добавлением продукта")
-            return "Ошибка нового продукта!"
-
-
-async def increasing_quantity_of_goods(name: str) -> str:
-    """
-    Увеличивает количество добавленного товара на 1.
-
-    Args:
-
-        name: Название товара
-
-    Returnes:
-
-        Увеличивает количество товара, возвращает строку с оповещением
+        Добавляет продукт с нулевым остатком одним запросом
+        INSERT ... RETURNING, возвращает ID нового продукта или None.
+        Остаток - это число непроданных кодов, он растёт только
+        при загрузке кодов (add_product_codes).
     """
+    if not (name and description and price and photo_id):
+        logger.debug(
+            "Проблема с добавлением продукта")
+        return None
     async with get_session() as session:
-        products = await session.execute(
-            select(Product).where(Product.product_name == name))
-        product = products.scalar_one_or_none()
-        if isinstance(product, Product):
-            product.amount += 1
-            await session.commit()
-            return True
-        else:
-            logger.debug(
-                "Товраа нет в базе или название передано неверно")
-            return False
+        product = (await session.execute(
+            insert(Product)
+            .values(product_name=name, description=description,
+                    price=price, amount=0, is_stock=False,
+                    photo_id=photo_id)
+            .returning(Product))).scalar_one()
+        await session.commit()
+        catalog_cache.add(_product_to_dict(product))
+        return product.id
 
 
 async def get_balance(user_id: int) -> float | str:
@@ -186,7 +193,7 @@ async def get_referal_code(user_id: int) -> str | int:
             return 0
 
 
-async def top_up_admin(user_id: int, amount: float) -> str:
+async def top_up_admin(user_id: int, amount: Decimal | float | str) -> str:
     """
     Пополнение баланса пользователя.
 
@@ -194,22 +201,29 @@ async def top_up_admin(user_id: int, amount: float) -> str:
 
         user_id: ID пользователя
         amount: Сумма на которую будет увеличен баланс
+
+    Returnes:
+
+        Увеличивает баланс одним запросом UPDATE ... RETURNING,
+        возвращает строку с оповещением и новым балансом
     """
     async with get_session() as session:
-        balances = await session.execute(
-            select(Balance).where(Balance.user_id == user_id))
-        balance = balances.scalar_one_or_none()
-        if isinstance(balance, Balance):
-            balance.quantity += amount
+        balance = await session.scalar(
+            update(Balance)
+            .where(Balance.user_id == user_id)
+            .values(quantity=Balance.quantity + Decimal(str(amount)))
+            .returning(Balance.quantity))
+        if balance is not None:
             await session.commit()
-            return "Баланс пополнен!"
+            return f"Баланс пополнен! Текущий баланс: {balance} р."
         else:
             logger.debug(
                 "Пользователя нет в базе или был передан неверный ID")
             return "Пользователя нет в базе или был передан неверный ID"
 
 
-async def write_off_admin(user_id: int, amount: float) -> str:
+async def write_off_admin(user_id: int,
+                          amount: Decimal | float | str) -> str:
     """
     Списание средств с баланса пользователя.
 
@@ -217,18 +231,36 @@ async def write_off_admin(user_id: int, amount: float) -> str:
 
         user_id: ID пользователя
         amount: Сумма на которую будет уменьшен баланс
-    """
+
+    Returnes:
+
+        Списывает сумму условным UPDATE ... WHERE quantity >= amount.
+        Баланс до списания читается в том же запросе, поэтому
+        нехватка средств отличается от отсутствия пользователя
+        без повторного обращения к базе.
+    """
+    amount = Decimal(str(amount))
+    debit = (
+        update(Balance)
+        .where(Balance.user_id == user_id)
+        .where(Balance.quantity >= amount)
+        .values(quantity=Balance.quantity - amount)
+        .returning(Balance.quantity)
+        .cte("debit")
+    )
+    request = select(
+        select(Balance.quantity)
+        .where(Balance.user_id == user_id)
+        .scalar_subquery().label("before"),
+        select(debit.c.quantity).scalar_subquery().label("after"))
     async with get_session() as session:
-        balances = await session.execute(
-            select(Balance).where(Balance.user_id == user_id))
-        balance = balances.scalar_one_or_none()
-        if isinstance(balance, Balance):
-            if balance.quantity >= amount:
-                balance.quantity -= amount
-                await session.commit()
-                return "Сумма списанна с баланса!"
-            else:
-                return "У пользователя нехвататет средств для списания!"
+        result = (await session.execute(request)).one()
+        if result.after is not None:
+            await session.commit()
+            return ("Сумма списанна с баланса! "
+                    f"Текущий баланс: {result.after} р.")
+        elif result.before is not None:
+            return "У пользователя нехвататет средств для списания!"
         else:
             return "Пользователя нет в базе или был передан неверный ID"
 
@@ -239,21 +271,90 @@ async def get_all_products() -> list[dict[str, Any]]:
 
     Returns:
         Возвращает список словарей, каждый словарь сожержит
-        информацию об одном конкретном товаре.
+        информацию об одном конкретном товаре. Повторные запросы
+        обслуживаются из кэша каталога без обращения к базе.
     """
-    async with get_session() as session:
-        result = await session.execute(select(Product))
-        product = result.scalars().all()
-        products = [{"id": item.id,
-                     "name": item.product_name,
-                     "description": item.description,
-                     "price": item.price,
-                     "amount": item.amount,
-                     "is_stock": item.is_stock,
-                     "photo_id": item.photo_id} for item in product]
+    products = catalog_cache.get()
+    if products is not None:
+        return products
+    async with _catalog_lock:
+        products = catalog_cache.get()
+        if products is not None:
+            return products
+        async with get_session() as session:
+            result = await session.execute(
+                select(Product).order_by(Product.id))
+            products = [_product_to_dict(item)
+                        for item in result.scalars().all()]
+        catalog_cache.fill(products)
         return products
 
 
+def _product_to_dict(item: Product) -> dict[str, Any]:
+    """Представление товара каталога в виде словаря."""
+    return {"id": item.id,
+            "name": item.product_name,
+            "description": item.description,
+            "price": item.price,
+            "amount": item.amount,
+            "is_stock": item.is_stock,
+            "photo_id": item.photo_id}
+
+
+async def get_products_page(cursor: int = 0, limit: int = 1,
+                            backward: bool = False
+                            ) -> tuple[list[dict[str, Any]], bool, bool]:
+    """
+    Получение страницы каталога по ключу (keyset-пагинация).
+
+    Args:
+        cursor: ID товара, от которого считается страница
+        limit: Количество товаров на странице
+        backward: Листать назад (товары с ID меньше курсора)
+
+    Returns:
+        Возвращает кортеж (товары, есть_предыдущая, есть_следующая).
+        Страница берётся из кэша каталога, а при пустом кэше -
+        запросом WHERE id > cursor LIMIT n, стоимость которого
+        не зависит от размера каталога. Кэш при этом прогревается
+        в фоне.
+    """
+    page = catalog_cache.page(cursor, limit, backward)
+    if page is not None:
+        return page
+    if not _catalog_lock.locked():
+        task = asyncio.create_task(get_all_products())
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+
+    other = aliased(Product)
+    if backward:
+        request = (
+            select(Product,
+                   exists().where(other.id >= cursor).label("more"))
+            .where(Product.id < cursor)
+            .order_by(Product.id.desc())
+            .limit(limit + 1)
+        )
+    else:
+        request = (
+            select(Product,
+                   exists().where(other.id <= cursor).label("more"))
+            .where(Product.id > cursor)
+            .order_by(Product.id)
+            .limit(limit + 1)
+        )
+    async with get_session() as session:
+        rows = (await session.execute(request)).all()
+    has_extra = len(rows) > limit
+    rows = rows[:limit]
+    more = rows[0].more if rows else False
+    products = [_product_to_dict(row.Product) for row in rows]
+    if backward:
+        return products[::-1], has_extra, more
+    return products, more, has_extra
+
+
 async def delete_item(item_id: int) -> str:
     """
     Удаление конкретного товара.
@@ -262,17 +363,18 @@ async def delete_item(item_id: int) -> str:
         item_id: ID товара
 
     Returns:
-        Удаляет товар из базы данных по переданному ID,
-        возвращает строку с оповещением: успех/провал операции
+        Удаляет товар из базы данных по переданному ID одним
+        запросом, возвращает строку с оповещением: успех/провал операции
     """
     async with get_session() as session:
-        results = await session.execute(
-            select(Product).where(Product.id == item_id))
-        result = results.scalar_one_or_none()
-        if isinstance(result, Product):
-            await session.delete(result)
+        name = await session.scalar(
+            delete(Product)
+            .where(Product.id == item_id)
+            .returning(Product.product_name))
+        if name is not None:
             await session.commit()
-            return "Товар удалён!"
+            catalog_cache.remove(item_id)
+            return f"Товар «{name}» удалён!"
         else:
             logger.debug("Ошибка удаления товара!")
             return "Ошибка удаления товара!"
@@ -287,26 +389,45 @@ async def add_to_cart(user_id: int, product_id: int) -> str:
         product_id: ID продукта
 
     Returns:
-        Добавляет продукт в корзину, возвращает строку
-        с оповещением
-    """
-    async with get_session() as session:
-        item = ShoppingCart(user_id=user_id,
-                            product_id=product_id)
-        if (
-            isinstance(item, ShoppingCart) and
-            item.user_id and item.product_id
-        ):
-            session.add(item)
+        Добавляет продукт в корзину или увеличивает его количество
+        одним запросом INSERT ... SELECT ... ON CONFLICT DO UPDATE,
+        возвращает строку с оповещением. Товар без остатка не
+        добавляется, и в корзине не может оказаться больше
+        штук, чем есть на складе.
+    """
+    if not (user_id and product_id):
+        logger.debug(
+            "Проблема с добавлением продукта")
+        return "Ошибка продукта или корзины!"
+    stock = (select(Product.amount)
+             .where(Product.id == product_id)
+             .scalar_subquery())
+    request = (
+        pg_insert(ShoppingCart)
+        .from_select(["user_id", "product_id", "quantity"],
+                     select(literal(user_id), Product.id, literal(1))
+                     .where(Product.id == product_id)
+                     .where(Product.is_stock.is_(True)))
+        .on_conflict_do_update(
+            index_elements=[ShoppingCart.user_id, ShoppingCart.product_id],
+            set_={"quantity": ShoppingCart.quantity + 1},
+            where=ShoppingCart.quantity < stock)
+        .returning(ShoppingCart.quantity)
+    )
+    try:
+        async with get_session() as session:
+            quantity = await session.scalar(request)
             await session.commit()
-            return "Продукт добавлен в корзину!"
-        else:
-            logger.debug(
-                "Проблема с добавлением продукта")
-            return "Ошибка продукта или корзины!"
+    except IntegrityError:
+        logger.debug(
+            "Проблема с добавлением продукта")
+        return "Ошибка продукта или корзины!"
+    if quantity is None:
+        return "Товара нет в наличии в таком количестве!"
+    return f"Продукт добавлен в корзину! В корзине: {quantity} шт."
 
 
-async def get_user_cart(user_id: int) -> Product:
+async def get_user_cart(user_id: int) -> list[Row]:
     """
     Получение корзины пользователя.
 
@@ -314,18 +435,18 @@ async def get_user_cart(user_id: int) -> Product:
         user_id: ID пользователя
 
     Returns:
-        Возвращает список продуктов, добавленных
-        конкретным пользователем
+        Возвращает список строк (Product, quantity) - продукты,
+        добавленные конкретным пользователем, и их количество
     """
     async with get_session() as session:
         request = (
-            select(Product)
+            select(Product, ShoppingCart.quantity)
             .join(ShoppingCart, Product.id == ShoppingCart.product_id)
             .where(ShoppingCart.user_id == user_id)
+            .order_by(ShoppingCart.id)
         )
         results = await session.execute(request)
-        result = results.scalars().all()
-        return result
+        return results.all()
 
 
 async def item_un_cart(user_id: int, product_id: int) -> str:
@@ -337,55 +458,63 @@ async def item_un_cart(user_id: int, product_id: int) -> str:
         product_id: ID продукта
 
     Returns:
-        ...
+        Удаляет строку товара из корзины одним запросом,
+        возвращает строку с названием удалённого товара
     """
     async with get_session() as session:
-        request = (
-            select(ShoppingCart)
+        name = await session.scalar(
+            delete(ShoppingCart.__table__)
             .where(ShoppingCart.user_id == user_id)
             .where(ShoppingCart.product_id == product_id)
-        )
-        results = await session.execute(request)
-        result = results.scalar_one_or_none()
-        if isinstance(result, ShoppingCart):
-            await session.delete(result)
+            .where(Product.id == ShoppingCart.product_id)
+            .returning(Product.product_name))
+        if name is not None:
             await session.commit()
-            return "Товар удалён из корзины!"
+            return f"Товар «{name}» удалён из корзины!"
         else:
             logger.debug("Ошибка удаления товара из корзины!")
             return "Ошибка удаления товара из корзины!"
 
 
-async def add_product_to_users_collection_tools(user_id: int,
-                                                product_name: str,
-                                                product_code: str,
-                                                photo_id: str) -> str:
+async def _insert_user_products(session: AsyncSession,
+                                items: list[UserProductRow]) -> list[int]:
     """
-    Добавление купленного товара в его личную коллекцию.
+    Вставка купленных товаров в рамках переданной сессии.
 
     Args:
-        user_id: ID пользователя
-        product_name: Название продукта
-        product_code: Цифровой код продукта
-        photo_id: ID Изображения продукта в телеграмме
+        session: Открытая сессия, коммит остаётся за вызывающим
+        items: Список кортежей (user_id, product_name, code, photo_id)
+
+    Returns:
+        Возвращает ID добавленных строк. Небольшие пачки пишутся
+        одним многострочным INSERT, большие - через COPY asyncpg
+        с заранее зарезервированными ID из последовательности.
     """
-    async with get_session() as session:
-        item = UserProduct(user_id=user_id,
-                           product_name=product_name,
-                           product_code=product_code,
-                           photo_id=photo_id)
-        if (
-            isinstance(item, UserProduct) and
-            item.user_id and item.product_name and
-            item.product_code and item.photo_id
-        ):
-            session.add(item)
-            await session.commit()
-            return "Продукт добавлен в коллекцию пользователя!"
-        else:
-            logger.debug(
-                "Ошибка добалвения в коллекцию пользователя!")
-            return "Ошибка добалвения в коллекцию пользователя!"
+    if len(items) < COPY_THRESHOLD:
+        result = await session.execute(
+            insert(UserProduct)
+            .values([{"user_id": user_id,
+                      "product_name": product_name,
+                      "product_code": product_code,
+                      "photo_id": photo_id}
+                     for user_id, product_name, product_code, photo_id
+                     in items])
+            .returning(UserProduct.id))
+        return list(result.scalars().all())
+
+    sequence = func.pg_get_serial_sequence(UserProduct.__tablename__, "id")
+    result = await session.execute(
+        select(func.nextval(sequence))
+        .select_from(func.generate_series(1, len(items))))
+    ids = list(result.scalars().all())
+    connection = await session.connection()
+    raw_connection = await connection.get_raw_connection()
+    await raw_connection.driver_connection.copy_records_to_table(
+        UserProduct.__tablename__,
+        records=[(item_id, *item) for item_id, item in zip(ids, items)],
+        columns=["id", "user_id", "product_name",
+                 "product_code", "photo_id"])
+    return ids
 
 
 async def get_user_collection_tools(user_id: int) -> UserProduct:
@@ -402,26 +531,443 @@ async def get_user_collection_tools(user_id: int) -> UserProduct:
         return product
 
 
-async def empty_the_basket(user_id: int) -> str:
+async def _claim_product_codes(session: AsyncSession, user_id: int,
+                               product_id: int, count: int) -> list[str]:
+    """
+    Захват непроданных кодов товара для покупателя.
+
+    Notes:
+
+        Коды выбираются SELECT ... FOR UPDATE SKIP LOCKED LIMIT count:
+        строки, которые сейчас забирает другой покупатель, пропускаются,
+        поэтому одновременные покупки одного товара не ждут друг друга.
+        Если кодов меньше count, возвращается сколько есть.
+    """
+    claimed = (
+        select(ProductCode.id)
+        .where(ProductCode.product_id == product_id)
+        .where(ProductCode.sold_at.is_(None))
+        .order_by(ProductCode.id)
+        .limit(count)
+        .with_for_update(skip_locked=True)
+        .cte("claimed")
+    )
+    result = await session.execute(
+        update(ProductCode)
+        .where(ProductCode.id == claimed.c.id)
+        .values(sold_to=user_id, sold_at=datetime.utcnow())
+        .returning(ProductCode.code))
+    return result.scalars().all()
+
+
+async def _claim_items(session: AsyncSession, user_id: int,
+                       items: list[Row]
+                       ) -> tuple[list[UserProductRow], dict[int, int],
+                                  list[tuple[Row, int]]]:
+    """
+    Захват кодов для строк покупки (product_id, quantity, ...).
+
+    Returns:
+        Возвращает строки для коллекции пользователя, количество
+        проданных кодов по товарам и строки, которым не хватило
+        кодов, с числом недостающих штук
     """
-    Очистка корзины.
+    rows: list[UserProductRow] = []
+    sold: dict[int, int] = {}
+    shortage: list[tuple[Row, int]] = []
+    for item in sorted(items, key=lambda item: item.product_id):
+        codes = await _claim_product_codes(session, user_id,
+                                           item.product_id, item.quantity)
+        if codes:
+            sold[item.product_id] = sold.get(item.product_id, 0) + len(codes)
+        rows.extend((user_id, item.product_name, code, item.photo_id)
+                    for code in codes)
+        if len(codes) < item.quantity:
+            shortage.append((item, item.quantity - len(codes)))
+    return rows, sold, shortage
+
+
+async def _update_stock(session: AsyncSession,
+                        sold: dict[int, int]) -> dict[int, int]:
+    """
+    Уменьшение остатков товаров на проданное количество.
+
+    Notes:
+
+        Остаток и флаг наличия меняются одним UPDATE на товар в
+        самом конце транзакции, чтобы блокировка строки товара
+        держалась только до коммита. Товары обновляются по
+        возрастанию id, поэтому встречные покупки не дают
+        взаимной блокировки.
+    """
+    stock: dict[int, int] = {}
+    for product_id in sorted(sold):
+        remaining = Product.amount - sold[product_id]
+        stock[product_id] = await session.scalar(
+            update(Product)
+            .where(Product.id == product_id)
+            .values(amount=remaining, is_stock=remaining > 0)
+            .returning(Product.amount))
+    return stock
+
+
+def _patch_stock(stock: dict[int, int]) -> None:
+    """Новые остатки товаров в кэш каталога после коммита."""
+    for product_id, amount in stock.items():
+        catalog_cache.patch(product_id, amount=amount, is_stock=amount > 0)
+
+
+async def add_product_codes(product_id: int,
+                            codes: list[str]) -> int | None:
+    """
+    Загрузка кодов товара на склад.
+
+    Args:
+        product_id: ID товара
+        codes: Коды товара
+
+    Returns:
+        Добавляет коды одним INSERT ... ON CONFLICT DO NOTHING
+        (повторно загруженные коды пропускаются) и в той же
+        транзакции увеличивает остаток товара. Возвращает
+        количество добавленных кодов или None, если товара нет.
+    """
+    codes = list(dict.fromkeys(code.strip() for code in codes
+                               if code.strip()))
+    if not codes:
+        return 0
+    async with get_session() as session:
+        try:
+            result = await session.execute(
+                pg_insert(ProductCode)
+                .values([{"product_id": product_id, "code": code}
+                         for code in codes])
+                .on_conflict_do_nothing(index_elements=[
+                    ProductCode.product_id, ProductCode.code])
+                .returning(ProductCode.id))
+        except IntegrityError:
+            logger.debug("Товара нет в базе или ID передан неверно")
+            return None
+        added = len(result.all())
+        # Отрицательная продажа - поступление на склад
+        stock = await _update_stock(session, {product_id: -added})
+        await session.commit()
+    _patch_stock(stock)
+    return added
+
+
+async def checkout_with_balance(user_id: int) -> str:
+    """
+    Оплата корзины с баланса одной транзакцией.
 
     Args:
         user_id: ID пользователя
 
     Returns:
-        Очищает корзину пользователя, возвращает
-        строку с оповещением об статусе операции
+        Забирает строки корзины одним DELETE ... RETURNING, считает
+        по ним сумму и списывает её условным UPDATE, затем забирает
+        коды товаров со склада и добавляет их в коллекцию
+        пользователя одной вставкой и уменьшает остатки. Если
+        средств или какого-то товара не хватает, транзакция
+        откатывается вместе с корзиной. Возвращает строку
+        с оповещением о статусе операции.
+
+    Notes:
+
+        Строки корзины удаляются до списания: повторное нажатие
+        "Оплатить" ждёт блокировки этих строк и после коммита
+        первой оплаты находит пустую корзину, а не списывает
+        ту же корзину второй раз.
     """
     async with get_session() as session:
         result = await session.execute(
-            select(ShoppingCart).where(ShoppingCart.user_id == user_id))
-        items = result.scalars().all()
-        if items:
-            for item in items:
-                await session.delete(item)
-            await session.commit()
-            return "Корзина очищенна!"
+            delete(ShoppingCart.__table__)
+            .where(ShoppingCart.user_id == user_id)
+            .where(Product.id == ShoppingCart.product_id)
+            .returning(ShoppingCart.product_id, ShoppingCart.quantity,
+                       Product.price, Product.product_name,
+                       Product.photo_id))
+        items = result.all()
+        if not items:
+            return "Корзина пуста!"
+        total = sum(item.price * item.quantity for item in items)
+        balance = await session.scalar(
+            update(Balance)
+            .where(Balance.user_id == user_id)
+            .where(Balance.quantity >= total)
+            .values(quantity=Balance.quantity - total)
+            .returning(Balance.quantity))
+        if balance is None:
+            await session.rollback()
+            return "На балансе недостаточно средств..."
+
+        rows, sold, shortage = await _claim_items(session, user_id, items)
+        if shortage:
+            await session.rollback()
+            return ("Недостаточно товара на складе: " +
+                    ", ".join(item.product_name for item, _ in shortage))
+        await _insert_user_products(session, rows)
+        stock = await _update_stock(session, sold)
+        await session.commit()
+    _patch_stock(stock)
+    return "Успешно, товары вы найдете в разделе 'МОИ ТОВАРЫ'."
+
+
+async def get_processed_payment(payment_id: str) -> ProcessedPayment | None:
+    """
+    Получение зачисленного платежа.
+
+    Args:
+        payment_id: ID платежа в системе yookassa
+
+    Returns:
+        Возвращает запись о зачислении, если платёж
+        уже был применён, иначе None
+    """
+    async with get_session() as session:
+        return await session.get(ProcessedPayment, payment_id)
+
+
+async def get_cart_shortage(user_id: int) -> list[str]:
+    """
+    Проверка наличия товаров корзины.
+
+    Args:
+        user_id: ID пользователя
+
+    Returns:
+        Возвращает названия товаров, которых в корзине
+        больше, чем осталось на складе
+    """
+    async with get_session() as session:
+        result = await session.execute(
+            select(Product.product_name)
+            .join(ShoppingCart, ShoppingCart.product_id == Product.id)
+            .where(ShoppingCart.user_id == user_id)
+            .where(ShoppingCart.quantity > Product.amount))
+        return result.scalars().all()
+
+
+async def create_order(user_id: int, purpose: str,
+                       amount: Decimal | float | str | None = None
+                       ) -> tuple[int, Decimal] | None:
+    """
+    Создание заказа до выставления счёта.
+
+    Args:
+        user_id: ID пользователя
+        purpose: Назначение платежа: top_up или cart
+        amount: Сумма пополнения (для корзины не нужна)
+
+    Returns:
+        Создаёт заказ в статусе new и возвращает его ID и сумму,
+        None если корзина пуста. Для оплаты корзины её строки
+        с текущими ценами копируются в order_items одним
+        INSERT ... SELECT, и сумма заказа считается по этой копии
+        в той же транзакции. Счёт выставляется ровно на эту сумму,
+        и после оплаты выдаются ровно эти товары, даже если
+        корзину изменят, пока создаётся платёж.
+    """
+    async with get_session() as session:
+        order_id = await session.scalar(
+            insert(Order)
+            .values(user_id=user_id, purpose=purpose, status="new",
+                    total_price=Decimal(str(amount or 0)))
+            .returning(Order.id))
+        if purpose == "cart":
+            await session.execute(
+                insert(OrderItem).from_select(
+                    ["order_id", "product_id", "quantity", "price"],
+                    select(literal(order_id), ShoppingCart.product_id,
+                           ShoppingCart.quantity, Product.price)
+                    .join(Product, Product.id == ShoppingCart.product_id)
+                    .where(ShoppingCart.user_id == user_id)))
+            total = await session.scalar(
+                update(Order)
+                .where(Order.id == order_id)
+                .values(total_price=select(
+                    func.coalesce(func.sum(OrderItem.price *
+                                           OrderItem.quantity), 0))
+                    .where(OrderItem.order_id == order_id)
+                    .scalar_subquery())
+                .returning(Order.total_price))
+            if not total:
+                await session.rollback()
+                return None
         else:
-            logger.debug("Ошибка очистки корзины!")
-            return "Ошибка очистки корзины!"
+            total = Decimal(str(amount))
+        await session.commit()
+        return order_id, total
+
+
+async def set_order_payment(order_id: int, payment_id: str) -> None:
+    """
+    Привязка выставленного счёта к заказу.
+
+    Args:
+        order_id: ID заказа
+        payment_id: ID платежа в системе yookassa
+
+    Returns:
+        Переводит заказ из new в pending, с этого момента
+        его сверяет фоновая сверка платежей
+    """
+    async with get_session() as session:
+        await session.execute(
+            update(Order)
+            .where(Order.id == order_id)
+            .where(Order.status == "new")
+            .values(payment_id=payment_id, status="pending"))
+        await session.commit()
+
+
+async def fail_order(order_id: int) -> None:
+    """Закрытие заказа, для которого не удалось выставить счёт."""
+    async with get_session() as session:
+        await session.execute(
+            update(Order)
+            .where(Order.id == order_id)
+            .where(Order.status == "new")
+            .values(status="failed"))
+        await session.commit()
+
+
+async def get_pending_orders() -> list[Row]:
+    """
+    Получение заказов, ожидающих оплаты.
+
+    Returns:
+        Возвращает строки (payment_id, date_order) заказов
+        со статусом pending, от старых к новым
+    """
+    async with get_session() as session:
+        result = await session.execute(
+            select(Order.payment_id, Order.date_order)
+            .where(Order.status == "pending")
+            .where(Order.payment_id.is_not(None))
+            .order_by(Order.date_order))
+        return result.all()
+
+
+async def close_orders(payment_ids: list[str], status: str) -> int:
+    """
+    Закрытие неоплаченных заказов.
+
+    Args:
+        payment_ids: ID платежей в системе yookassa
+        status: Новый статус заказа: canceled или expired
+
+    Returns:
+        Меняет статус только заказов в состоянии pending,
+        возвращает количество закрытых заказов
+    """
+    if not payment_ids:
+        return 0
+    async with get_session() as session:
+        result = await session.execute(
+            update(Order)
+            .where(Order.payment_id.in_(payment_ids))
+            .where(Order.status == "pending")
+            .values(status=status)
+            .returning(Order.id))
+        closed = len(result.all())
+        await session.commit()
+        return closed
+
+
+async def apply_payment(payment_id: str, user_id: int, purpose: str,
+                        amount: Decimal | float | str) -> str | None:
+    """
+    Зачисление успешного платежа ровно один раз.
+
+    Args:
+        payment_id: ID платежа в системе yookassa
+        user_id: ID пользователя из метаданных платежа
+        purpose: Назначение платежа: top_up или cart
+        amount: Оплаченная сумма
+
+    Returns:
+        Возвращает строку с оповещением для пользователя,
+        None если платёж уже был зачислен ранее.
+
+    Notes:
+
+        ID платежа записывается в processed_payments через
+        INSERT ... ON CONFLICT DO NOTHING в той же транзакции,
+        что и зачисление. Повторные уведомления, сверка и нажатия
+        "Проверить оплату" (в том числе одновременные) ничего
+        не вставят и ничего не зачислят. Оплата корзины выдаёт
+        коды товаров, сохранённых в заказе при выставлении счёта,
+        и убирает их из корзины, если оплачена вся сумма заказа.
+        Стоимость товаров, удалённых из каталога или закончившихся
+        на складе, платежи без заказа и платежи на сумму меньше
+        заказа зачисляются на баланс.
+    """
+    amount = Decimal(str(amount))
+    async with get_session() as session:
+        inserted = await session.scalar(
+            pg_insert(ProcessedPayment)
+            .values(payment_id=payment_id, user_id=user_id,
+                    purpose=purpose, amount=amount)
+            .on_conflict_do_nothing(index_elements=[
+                ProcessedPayment.payment_id])
+            .returning(ProcessedPayment.payment_id))
+        if inserted is None:
+            return None
+        order = (await session.execute(
+            update(Order)
+            .where(Order.payment_id == payment_id)
+            .values(status="paid")
+            .returning(Order.id, Order.total_price))).one_or_none()
+
+        refund = amount
+        granted = False
+        stock: dict[int, int] = {}
+        # Товары выдаются, только если оплачена вся сумма заказа
+        if (purpose == "cart" and order is not None and
+                amount >= order.total_price):
+            order_id = order.id
+            items = (await session.execute(
+                select(OrderItem.product_id, OrderItem.quantity,
+                       OrderItem.price, Product.product_name,
+                       Product.photo_id)
+                .join(Product, Product.id == OrderItem.product_id)
+                .where(OrderItem.order_id == order_id))).all()
+            rows, sold, shortage = await _claim_items(session, user_id,
+                                                      items)
+            if rows:
+                await _insert_user_products(session, rows)
+                granted = True
+            if items:
+                await session.execute(
+                    delete(ShoppingCart)
+                    .where(ShoppingCart.user_id == user_id)
+                    .where(ShoppingCart.product_id.in_(
+                        [item.product_id for item in items])))
+            paid_for = (sum(item.price * item.quantity for item in items) -
+                        sum(item.price * missing
+                            for item, missing in shortage))
+            refund = max(amount - paid_for, Decimal(0))
+            stock = await _update_stock(session, sold)
+        message = "Успешно, товары вы найдете в разделе 'МОИ ТОВАРЫ'."
+        if refund or not granted:
+            balance = await session.scalar(
+                update(Balance)
+                .where(Balance.user_id == user_id)
+                .values(quantity=Balance.quantity + refund)
+                .returning(Balance.quantity))
+            if balance is None:
+                await session.rollback()
+                raise ValueError(f"Пользователь {user_id} не найден")
+            if granted:
+                message += (" Стоимость недостающих товаров зачислена "
+                            f"на баланс. Текущий баланс: {balance} р.")
+            elif purpose == "cart":
+                message = ("Товары из счёта не выданы, "
+                           "сумма зачислена на баланс. "
+                           f"Текущий баланс: {balance} р.")
+            else:
+                message = f"Баланс пополнен! Текущий баланс: {balance} р."
+        await session.commit()
+    _patch_stock(stock)
+    return message
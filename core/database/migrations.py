@@ -0,0 +1,317 @@
+"""
+Версионные миграции схемы базы данных.
+
+Args:
+    MIGRATIONS: Упорядоченный список миграций (версия, описание, шаг)
+    LATEST_VERSION: Версия схемы, которую ожидает приложение
+
+Func:
+    get_schema_version: Текущая версия схемы в базе
+    apply_migrations: Применение недостающих миграций при старте
+
+Notes:
+
+    Каждый шаг описывает схему явным DDL на момент своей версии и
+    не читает текущие модели: иначе на пустой базе первый шаг
+    создал бы схему HEAD, и более поздние шаги упирались бы в уже
+    существующие колонки. IF [NOT] EXISTS в шагах нужен только для
+    баз, созданных до появления миграций через create_all.
+    Новая таблица или колонка в моделях добавляется новым шагом,
+    уже выпущенные шаги не меняются.
+"""
+import logging
+from typing import Awaitable, Callable
+
+from sqlalchemy import insert, select, text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from core.db_models.models import engine, SchemaVersion
+
+
+logger = logging.getLogger(__name__)
+
+# Ключ advisory-блокировки, чтобы несколько процессов
+# не применяли миграции одновременно
+MIGRATION_LOCK_KEY = 7_305_001
+
+
+async def _initial_schema(conn: AsyncConnection) -> None:
+    """Исходная схема бота, какой её создавал create_all до миграций."""
+    statements = [
+        "CREATE TABLE IF NOT EXISTS schema_version ("
+        " version SERIAL NOT NULL,"
+        " description VARCHAR NOT NULL,"
+        " applied_at TIMESTAMP WITHOUT TIME ZONE,"
+        " PRIMARY KEY (version))",
+        "CREATE TABLE IF NOT EXISTS myproducts ("
+        " id SERIAL NOT NULL,"
+        " user_id INTEGER,"
+        " product_name VARCHAR NOT NULL,"
+        " product_code VARCHAR NOT NULL,"
+        " photo_id VARCHAR NOT NULL,"
+        " PRIMARY KEY (id))",
+        "CREATE TABLE IF NOT EXISTS products ("
+        " id SERIAL NOT NULL,"
+        " product_name VARCHAR(100) NOT NULL,"
+        " description VARCHAR,"
+        " price DECIMAL(10, 2) NOT NULL,"
+        " amount INTEGER NOT NULL,"
+        " is_stock BOOLEAN,"
+        " photo_id VARCHAR NOT NULL,"
+        " PRIMARY KEY (id))",
+        "CREATE TABLE IF NOT EXISTS users ("
+        " tg_id SERIAL NOT NULL,"
+        " referal_code VARCHAR NOT NULL,"
+        " referred_by INTEGER,"
+        " PRIMARY KEY (tg_id),"
+        " UNIQUE (referal_code),"
+        " FOREIGN KEY (referred_by) REFERENCES users (tg_id))",
+        "CREATE TABLE IF NOT EXISTS balances ("
+        " user_id INTEGER NOT NULL,"
+        " quantity DECIMAL(10, 2),"
+        " PRIMARY KEY (user_id),"
+        " FOREIGN KEY (user_id) REFERENCES users (tg_id))",
+        "CREATE TABLE IF NOT EXISTS orders ("
+        " id SERIAL NOT NULL,"
+        " user_id INTEGER,"
+        " date_order TIMESTAMP WITHOUT TIME ZONE,"
+        " status VARCHAR,"
+        " total_price DECIMAL(10, 2) NOT NULL,"
+        " PRIMARY KEY (id),"
+        " FOREIGN KEY (user_id) REFERENCES users (tg_id))",
+        "CREATE TABLE IF NOT EXISTS shopping_cart ("
+        " id SERIAL NOT NULL,"
+        " user_id INTEGER,"
+        " product_id INTEGER,"
+        " PRIMARY KEY (id),"
+        " FOREIGN KEY (user_id) REFERENCES users (tg_id),"
+        " FOREIGN KEY (product_id) REFERENCES products (id)"
+        " ON DELETE CASCADE)",
+        "CREATE TABLE IF NOT EXISTS order_items ("
+        " id SERIAL NOT NULL,"
+        " order_id INTEGER,"
+        " product_id INTEGER,"
+        " quantity INTEGER NOT NULL,"
+        " price DECIMAL(10, 2) NOT NULL,"
+        " PRIMARY KEY (id),"
+        " FOREIGN KEY (order_id) REFERENCES orders (id),"
+        " FOREIGN KEY (product_id) REFERENCES products (id))",
+    ]
+    for statement in statements:
+        await conn.execute(text(statement))
+
+
+async def _hot_path_indexes(conn: AsyncConnection) -> None:
+    """Индексы по колонкам, по которым идут частые выборки."""
+    statements = [
+        "CREATE INDEX IF NOT EXISTS ix_shopping_cart_user_id_product_id "
+        "ON shopping_cart (user_id, product_id)",
+        "CREATE INDEX IF NOT EXISTS ix_shopping_cart_product_id "
+        "ON shopping_cart (product_id)",
+        "CREATE INDEX IF NOT EXISTS ix_myproducts_user_id "
+        "ON myproducts (user_id)",
+        "CREATE INDEX IF NOT EXISTS ix_orders_user_id "
+        "ON orders (user_id)",
+        "CREATE INDEX IF NOT EXISTS ix_order_items_order_id "
+        "ON order_items (order_id)",
+        "CREATE INDEX IF NOT EXISTS ix_products_product_name "
+        "ON products (product_name)",
+    ]
+    for statement in statements:
+        await conn.execute(text(statement))
+
+
+async def _cart_line_quantity(conn: AsyncConnection) -> None:
+    """Количество в строке корзины, одна строка на пару (user, product)."""
+    statements = [
+        "ALTER TABLE shopping_cart "
+        "ADD COLUMN IF NOT EXISTS quantity INTEGER NOT NULL DEFAULT 1",
+        # Дубликаты, накопленные до появления quantity, сворачиваются
+        # в самую раннюю строку пары
+        "UPDATE shopping_cart AS cart SET quantity = merged.total "
+        "FROM (SELECT min(id) AS keep_id, sum(quantity) AS total "
+        "      FROM shopping_cart GROUP BY user_id, product_id "
+        "      HAVING count(*) > 1) AS merged "
+        "WHERE cart.id = merged.keep_id",
+        "DELETE FROM shopping_cart AS cart USING shopping_cart AS kept "
+        "WHERE cart.user_id = kept.user_id "
+        "AND cart.product_id = kept.product_id AND cart.id > kept.id",
+        "DROP INDEX IF EXISTS ix_shopping_cart_user_id_product_id",
+        "CREATE UNIQUE INDEX IF NOT EXISTS "
+        "uq_shopping_cart_user_id_product_id "
+        "ON shopping_cart (user_id, product_id)",
+    ]
+    for statement in statements:
+        await conn.execute(text(statement))
+
+
+async def _fsm_records(conn: AsyncConnection) -> None:
+    """Таблица хранилища машины состояний."""
+    statements = [
+        "CREATE TABLE IF NOT EXISTS fsm_records ("
+        " key VARCHAR NOT NULL,"
+        " state VARCHAR,"
+        " data TEXT NOT NULL,"
+        " expires_at TIMESTAMP WITHOUT TIME ZONE,"
+        " PRIMARY KEY (key))",
+        "CREATE INDEX IF NOT EXISTS ix_fsm_records_expires_at "
+        "ON fsm_records (expires_at)",
+    ]
+    for statement in statements:
+        await conn.execute(text(statement))
+
+
+async def _processed_payments(conn: AsyncConnection) -> None:
+    """Таблица зачисленных платежей yookassa."""
+    statements = [
+        "CREATE TABLE IF NOT EXISTS processed_payments ("
+        " payment_id VARCHAR NOT NULL,"
+        " user_id INTEGER NOT NULL,"
+        " purpose VARCHAR NOT NULL,"
+        " amount DECIMAL(10, 2) NOT NULL,"
+        " processed_at TIMESTAMP WITHOUT TIME ZONE,"
+        " PRIMARY KEY (payment_id))",
+        "CREATE INDEX IF NOT EXISTS ix_processed_payments_user_id "
+        "ON processed_payments (user_id)",
+    ]
+    for statement in statements:
+        await conn.execute(text(statement))
+
+
+async def _order_payments(conn: AsyncConnection) -> None:
+    """Платёж yookassa и назначение в заказе для сверки платежей."""
+    statements = [
+        "ALTER TABLE orders ADD COLUMN IF NOT EXISTS payment_id VARCHAR",
+        "ALTER TABLE orders ADD COLUMN IF NOT EXISTS purpose VARCHAR",
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_orders_payment_id "
+        "ON orders (payment_id)",
+        "CREATE INDEX IF NOT EXISTS ix_orders_pending "
+        "ON orders (date_order) WHERE status = 'pending'",
+        # Удаление товара из каталога не должно упираться в старые заказы
+        "ALTER TABLE order_items "
+        "DROP CONSTRAINT IF EXISTS order_items_product_id_fkey",
+        "ALTER TABLE order_items ADD CONSTRAINT order_items_product_id_fkey "
+        "FOREIGN KEY (product_id) REFERENCES products (id) "
+        "ON DELETE SET NULL",
+    ]
+    for statement in statements:
+        await conn.execute(text(statement))
+
+
+async def _reserved_codes(conn: AsyncConnection) -> None:
+    """Таблица выданных кодов, заполненная уже использованными кодами."""
+    statements = [
+        "CREATE TABLE IF NOT EXISTS reserved_codes ("
+        " code VARCHAR NOT NULL,"
+        " kind VARCHAR NOT NULL,"
+        " reserved_at TIMESTAMP WITHOUT TIME ZONE,"
+        " PRIMARY KEY (code))",
+        "INSERT INTO reserved_codes (code, kind, reserved_at) "
+        "SELECT referal_code, 'referral', now() FROM users "
+        "ON CONFLICT DO NOTHING",
+        "INSERT INTO reserved_codes (code, kind, reserved_at) "
+        "SELECT DISTINCT product_code, 'gift', now() FROM myproducts "
+        "ON CONFLICT DO NOTHING",
+    ]
+    for statement in statements:
+        await conn.execute(text(statement))
+
+
+async def _product_codes(conn: AsyncConnection) -> None:
+    """Склад кодов товаров, остаток товара считается по кодам."""
+    statements = [
+        "CREATE TABLE IF NOT EXISTS product_codes ("
+        " id SERIAL NOT NULL,"
+        " product_id INTEGER NOT NULL,"
+        " code VARCHAR NOT NULL,"
+        " sold_to INTEGER,"
+        " sold_at TIMESTAMP WITHOUT TIME ZONE,"
+        " PRIMARY KEY (id),"
+        " FOREIGN KEY (product_id) REFERENCES products (id)"
+        " ON DELETE CASCADE)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_product_codes_product_id_code "
+        "ON product_codes (product_id, code)",
+        "CREATE INDEX IF NOT EXISTS ix_product_codes_available "
+        "ON product_codes (product_id, id) WHERE sold_at IS NULL",
+        "UPDATE products SET amount = stock.available, "
+        "is_stock = stock.available > 0 "
+        "FROM (SELECT products.id, count(product_codes.id) AS available "
+        "      FROM products LEFT JOIN product_codes "
+        "      ON product_codes.product_id = products.id "
+        "      AND product_codes.sold_at IS NULL "
+        "      GROUP BY products.id) AS stock "
+        "WHERE products.id = stock.id",
+    ]
+    for statement in statements:
+        await conn.execute(text(statement))
+
+
+Migration = tuple[int, str, Callable[[AsyncConnection], Awaitable[None]]]
+
+MIGRATIONS: list[Migration] = [
+    (1, "Начальная схема", _initial_schema),
+    (2, "Индексы для корзины, коллекций, заказов и каталога",
+     _hot_path_indexes),
+    (3, "Количество в корзине, уникальная строка (user_id, product_id)",
+     _cart_line_quantity),
+    (4, "Хранилище состояний FSM", _fsm_records),
+    (5, "Зачисленные платежи yookassa", _processed_payments),
+    (6, "Платёж и назначение в заказе", _order_payments),
+    (7, "Пул уникальных кодов", _reserved_codes),
+    (8, "Склад кодов товаров", _product_codes),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+async def get_schema_version(conn: AsyncConnection) -> int:
+    """
+    Получение текущей версии схемы.
+
+    Args:
+        conn: Соединение с базой данных
+
+    Returns:
+        Возвращает номер последней применённой миграции,
+        0 если таблицы версий ещё нет
+    """
+    exists = await conn.scalar(
+        text("SELECT to_regclass(:name) IS NOT NULL"),
+        {"name": SchemaVersion.__tablename__})
+    if not exists:
+        return 0
+    version = await conn.scalar(
+        select(SchemaVersion.version)
+        .order_by(SchemaVersion.version.desc())
+        .limit(1))
+    return version or 0
+
+
+async def apply_migrations() -> int:
+    """
+    Применение недостающих миграций.
+
+    Returns:
+        Сравнивает версию схемы в базе с LATEST_VERSION и применяет
+        только недостающие миграции в одной транзакции,
+        возвращает итоговую версию схемы.
+    """
+    async with engine.connect() as conn:
+        version = await get_schema_version(conn)
+    if version >= LATEST_VERSION:
+        logger.info(f"Схема БД актуальна, версия {version}")
+        return version
+
+    async with engine.begin() as conn:
+        await conn.execute(text("SELECT pg_advisory_xact_lock(:key)"),
+                           {"key": MIGRATION_LOCK_KEY})
+        version = await get_schema_version(conn)
+        for number, description, step in MIGRATIONS:
+            if number <= version:
+                continue
+            logger.info(f"Применение миграции {number}: {description}")
+            await step(conn)
+            await conn.execute(insert(SchemaVersion).values(
+                version=number, description=description))
+            version = number
+    return version
@@ -0,0 +1,220 @@
+"""
+Хранилище машины состояний aiogram в PostgreSQL.
+
+Classes:
+    PostgresStorage: FSM-хранилище с буфером записи в памяти
+"""
+import asyncio
+import json
+import logging
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import Any
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import (BaseStorage, DefaultKeyBuilder,
+                                      StateType, StorageKey)
+from sqlalchemy import delete, or_, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from core.db_models.models import async_session, FsmRecord
+
+
+logger = logging.getLogger(__name__)
+
+# Через сколько секунд без обращений чистая запись вытесняется из памяти
+MEMORY_IDLE_SECONDS = 300
+
+
+def _encode(value: Any) -> Any:
+    """Сериализация типов, которых нет в JSON (цены хранятся в Decimal)."""
+    if isinstance(value, Decimal):
+        return {"__decimal__": str(value)}
+    raise TypeError(f"Тип {type(value).__name__} не сериализуется в JSON")
+
+
+def _decode(value: dict[str, Any]) -> Any:
+    """Обратное преобразование значений, сохранённых через _encode."""
+    if set(value) == {"__decimal__"}:
+        return Decimal(value["__decimal__"])
+    return value
+
+
+@dataclass
+class _Record:
+    """Запись буфера: состояние, данные и служебные отметки."""
+
+    state: str | None = None
+    data: dict[str, Any] = field(default_factory=dict)
+    expires_at: float = 0.0
+    touched_at: float = 0.0
+    dirty: bool = False
+
+
+class PostgresStorage(BaseStorage):
+    """
+    FSM-хранилище в PostgreSQL с буфером записи в памяти.
+
+    Notes:
+
+        Если пользователь закреплён за процессом (pinned: один
+        процесс polling или воркеры супервизора), чтения
+        обслуживаются из памяти, а изменения сбрасываются в таблицу
+        fsm_records одним запросом раз в flush_interval секунд
+        (при 0 - сразу при записи). Если пользователи не закреплены
+        (несколько реплик webhook за балансировщиком), состояние
+        могла изменить другая реплика: каждое чтение берёт запись
+        из базы, а запись сразу сбрасывается в базу независимо от
+        flush_interval. У каждого ключа свой срок жизни ttl, после
+        которого состояние считается брошенным и очищается.
+    """
+
+    def __init__(self, ttl: int, flush_interval: float,
+                 pinned: bool = True):
+        """Метод инициализации класса."""
+        self.ttl = ttl
+        self.pinned = pinned
+        self.flush_interval = flush_interval if pinned else 0
+        self.key_builder = DefaultKeyBuilder(with_bot_id=True,
+                                             with_destiny=True)
+        self._records: dict[str, _Record] = {}
+        self._lock = asyncio.Lock()
+        self._flusher: asyncio.Task | None = None
+
+    async def _fetch(self, key: str, now: float) -> _Record:
+        """Чтение записи из базы, пустая запись если строки нет."""
+        async with async_session() as session:
+            row = (await session.execute(
+                select(FsmRecord.state, FsmRecord.data,
+                       FsmRecord.expires_at)
+                .where(FsmRecord.key == key)
+                .where(or_(FsmRecord.expires_at.is_(None),
+                           FsmRecord.expires_at > datetime.utcnow()))
+            )).one_or_none()
+        if row is None:
+            return _Record(expires_at=now + self.ttl)
+        return _Record(
+            state=row.state,
+            data=json.loads(row.data, object_hook=_decode),
+            expires_at=now + (
+                (row.expires_at - datetime.utcnow()).total_seconds()
+                if row.expires_at is not None else self.ttl))
+
+    async def _load(self, key: str) -> _Record:
+        """
+        Запись ключа из памяти или из базы.
+
+        Notes:
+
+            Истёкшая запись заменяется пустой, но не помечается
+            изменённой: её строка в базе истекает в тот же момент
+            и удаляется при flush, а DELETE по ключу мог бы стереть
+            состояние, которое только что записала другая реплика.
+        """
+        now = time.time()
+        record = self._records.get(key)
+        if record is not None and record.expires_at <= now:
+            record = self._records[key] = _Record(expires_at=now + self.ttl)
+        if record is None or not (self.pinned or record.dirty):
+            record = self._records[key] = await self._fetch(key, now)
+        record.touched_at = now
+        return record
+
+    async def _save(self, key: str, record: _Record) -> None:
+        """Отметка об изменении записи и запись в базу при необходимости."""
+        now = time.time()
+        record.expires_at = now + self.ttl
+        record.touched_at = now
+        record.dirty = True
+        if self.flush_interval <= 0:
+            await self.flush()
+        elif self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        """Установка состояния для ключа."""
+        name = self.key_builder.build(key)
+        record = await self._load(name)
+        record.state = state.state if isinstance(state, State) else state
+        await self._save(name, record)
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        """Получение состояния ключа."""
+        return (await self._load(self.key_builder.build(key))).state
+
+    async def set_data(self, key: StorageKey, data: dict[str, Any]) -> None:
+        """Запись данных ключа (с заменой)."""
+        name = self.key_builder.build(key)
+        record = await self._load(name)
+        record.data = data.copy()
+        await self._save(name, record)
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        """Получение данных ключа."""
+        return (await self._load(self.key_builder.build(key))).data.copy()
+
+    async def flush(self) -> None:
+        """
+        Запись изменённых записей в базу.
+
+        Notes:
+
+            Непустые записи пишутся одним INSERT ... ON CONFLICT,
+            пустые (состояние сброшено) удаляются одним DELETE.
+            Заодно удаляются просроченные строки и из памяти
+            вытесняются давно не использованные записи.
+        """
+        async with self._lock:
+            dirty = {key: record for key, record in self._records.items()
+                     if record.dirty}
+            for record in dirty.values():
+                record.dirty = False
+            now = time.time()
+            rows = [{"key": key,
+                     "state": record.state,
+                     "data": json.dumps(record.data, default=_encode),
+                     "expires_at": datetime.utcnow() + timedelta(
+                         seconds=record.expires_at - now)}
+                    for key, record in dirty.items()
+                    if record.state is not None or record.data]
+            empty = [key for key, record in dirty.items()
+                     if record.state is None and not record.data]
+            try:
+                async with async_session() as session:
+                    if rows:
+                        request = pg_insert(FsmRecord).values(rows)
+                        await session.execute(request.on_conflict_do_update(
+                            index_elements=[FsmRecord.key],
+                            set_={"state": request.excluded.state,
+                                  "data": request.excluded.data,
+                                  "expires_at": request.excluded.expires_at}))
+                    await session.execute(
+                        delete(FsmRecord).where(or_(
+                            FsmRecord.key.in_(empty),
+                            FsmRecord.expires_at <= datetime.utcnow())))
+                    await session.commit()
+            except Exception:
+                for record in dirty.values():
+                    record.dirty = True
+                raise
+            for key in [key for key, record in self._records.items()
+                        if not record.dirty and
+                        now - record.touched_at > MEMORY_IDLE_SECONDS]:
+                del self._records[key]
+
+    async def _flush_loop(self) -> None:
+        """Фоновая запись буфера, пока в нём есть изменения."""
+        while any(record.dirty for record in self._records.values()):
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as ex:
+                logger.debug(f"Ошибка записи состояний FSM {ex}")
+
+    async def close(self) -> None:
+        """Запись оставшихся изменений при остановке бота."""
+        if self._flusher is not None:
+            self._flusher.cancel()
+        await self.flush()
@@ -7,6 +7,7 @@ Args:
     async_session: Конфигуратор асинхронной сессии
 
 Classes:
+    InstrumentedPool: Пул соединений со сбором статистики
     Base: Базовый декларотивный класс
     User: Пользователь
     Product: Продукт
@@ -14,21 +15,102 @@ Classes:
     Order: Заказ
     OrderItem: Элементы заказа
     Balance: Баланс
+    UserProduct: Купленные товары пользователя
+    SchemaVersion: Версия схемы базы данных
+    FsmRecord: Состояние машины состояний aiogram
+    ProcessedPayment: Зачисленный платёж yookassa
+    ReservedCode: Выданный пулу уникальный код
+    ProductCode: Код товара на складе
 
 Func:
     get_session: Генератор асинхронной сессии
+    get_pool_stats: Текущее состояние пула соединений
 """
+import time
 from datetime import datetime
 from sqlalchemy.orm import DeclarativeBase, relationship, sessionmaker
 from sqlalchemy import (DECIMAL, Boolean, Column, DateTime,
-                        ForeignKey, Integer, String)
+                        ForeignKey, Index, Integer, String, Text, text)
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
-from config import PG_USER, PG_PASS, PG_HOST, PG_NAME
+from config import (PG_USER, PG_PASS, PG_HOST, PG_NAME, DB_ECHO,
+                    DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT,
+                    DB_POOL_PRE_PING, DB_POOL_RECYCLE,
+                    DB_STATEMENT_CACHE_SIZE)
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """
+    Пул соединений, собирающий статистику ожидания.
+
+    Notes:
+
+        Считает количество выдач соединений, время ожидания
+        свободного соединения и количество таймаутов, чтобы
+        размер пула подбирался по данным, а не наугад. Прочие
+        ошибки выдачи (отказ в соединении, авторизация, pre-ping)
+        к ожиданию пула отношения не имеют и не учитываются.
+    """
+
+    def __init__(self, *args, **kwargs):
+        """Метод инициализации класса."""
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def _do_get(self):
+        """Выдача соединения с замером времени ожидания."""
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            self.timeouts += 1
+            self._record_wait(started)
+            raise
+        self._record_wait(started)
+        return connection
+
+    def _record_wait(self, started: float) -> None:
+        """Учёт выдачи соединения и времени её ожидания."""
+        waited = time.perf_counter() - started
+        self.checkouts += 1
+        self.wait_total += waited
+        self.wait_max = max(self.wait_max, waited)
+
+    def stats(self) -> dict[str, int | float]:
+        """Снимок текущего состояния пула."""
+        return {
+            "size": self.size(),
+            "checked_out": self.checkedout(),
+            "checked_in": self.checkedin(),
+            "overflow": self.overflow(),
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            "wait_avg_ms": round(
+                self.wait_total / self.checkouts * 1000, 3
+            ) if self.checkouts else 0.0,
+            "wait_max_ms": round(self.wait_max * 1000, 3),
+        }
 
 
 DB_URI = f"postgresql+asyncpg://{PG_USER}:{PG_PASS}@{PG_HOST}/{PG_NAME}"
-engine = create_async_engine(DB_URI, echo=True)
+engine = create_async_engine(
+    DB_URI,
+    echo=DB_ECHO,
+    poolclass=InstrumentedPool,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_pre_ping=DB_POOL_PRE_PING,
+    pool_recycle=DB_POOL_RECYCLE,
+    connect_args={
+        "prepared_statement_cache_size": DB_STATEMENT_CACHE_SIZE,
+    },
+)
 
 
 async_session = sessionmaker(
@@ -38,6 +120,17 @@ async_session = sessionmaker(
 )
 
 
+def get_pool_stats() -> dict[str, int | float]:
+    """
+    Получение статистики пула соединений.
+
+    Returns:
+        Возвращает словарь с размером пула, количеством занятых
+        соединений, переполнением и временем ожидания соединения.
+    """
+    return engine.sync_engine.pool.stats()
+
+
 class Base(DeclarativeBase):
     ...
 
@@ -79,14 +172,14 @@ class Product(Base):
         product_name: Название
         description: Описание
         price: Цена
-        amount: Количество на складе
+        amount: Количество непроданных кодов на складе
         is_stock: Наличие на складе
         photo_id: ID фото в телеграмме
     """
     __tablename__ = 'products'
 
     id = Column(Integer, primary_key=True)
-    product_name = Column(String(100), nullable=False)
+    product_name = Column(String(100), nullable=False, index=True)
     description = Column(String, nullable=True)
     price = Column(DECIMAL(10, 2), nullable=False)
     amount = Column(Integer, nullable=False, default=0)
@@ -108,10 +201,16 @@ class ShoppingCart(Base):
         product: Связь с таблицей Product
     """
     __tablename__ = 'shopping_cart'
+    __table_args__ = (
+        Index('uq_shopping_cart_user_id_product_id', 'user_id', 'product_id',
+              unique=True),
+    )
 
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey('users.tg_id'))
-    product_id = Column(Integer, ForeignKey('products.id', ondelete="CASCADE"))
+    product_id = Column(Integer, ForeignKey('products.id', ondelete="CASCADE"),
+                        index=True)
+    quantity = Column(Integer, nullable=False, default=1, server_default="1")
 
     user = relationship('User', back_populates="shopping_cart")
     product = relationship('Product')
@@ -125,19 +224,30 @@ class Order(Base):
         id: ID заказа
         user_id: ID пользователя корзины
         date_order: Время заказа
-        status: Статус заказа
+        status: Статус заказа: new (счёт ещё не выставлен), pending,
+            paid, canceled, expired или failed (счёт не выставлен)
         total_price: Итоговая стоимость заказа
+        payment_id: ID платежа в системе yookassa
+        purpose: Назначение платежа: top_up или cart
 
         user: Связь с таблицей User
         order_items: Связь с таблицей OrderItems
     '''
     __tablename__ = 'orders'
+    __table_args__ = (
+        Index('uq_orders_payment_id', 'payment_id', unique=True),
+        # Сверка платежей выбирает только ожидающие оплаты заказы
+        Index('ix_orders_pending', 'date_order',
+              postgresql_where=text("status = 'pending'")),
+    )
 
     id = Column(Integer, primary_key=True)
-    user_id = Column(Integer, ForeignKey('users.tg_id'))
+    user_id = Column(Integer, ForeignKey('users.tg_id'), index=True)
     date_order = Column(DateTime, default=datetime.utcnow)
     status = Column(String, default='pending')
     total_price = Column(DECIMAL(10, 2), nullable=False)
+    payment_id = Column(String, nullable=True)
+    purpose = Column(String, nullable=True)
 
     user = relationship('User', back_populates="orders")
     order_items = relationship('OrderItem',
@@ -162,8 +272,9 @@ class OrderItem(Base):
     __tablename__ = 'order_items'
 
     id = Column(Integer, primary_key=True)
-    order_id = Column(Integer, ForeignKey('orders.id'))
-    product_id = Column(Integer, ForeignKey('products.id'))
+    order_id = Column(Integer, ForeignKey('orders.id'), index=True)
+    product_id = Column(Integer, ForeignKey('products.id',
+                                            ondelete="SET NULL"))
     quantity = Column(Integer, nullable=False)
     price = Column(DECIMAL(10, 2), nullable=False)
 
@@ -201,7 +312,109 @@ class UserProduct(Base):
     __tablename__ = "myproducts"
 
     id = Column(Integer, primary_key=True)
-    user_id = Column(Integer)
+    user_id = Column(Integer, index=True)
     product_name = Column(String, nullable=False)
     product_code = Column(String, nullable=False)
     photo_id = Column(String, nullable=False)
+
+
+class SchemaVersion(Base):
+    """
+    Версия схемы базы данных.
+
+    Args:
+        version: Номер применённой миграции
+        description: Описание миграции
+        applied_at: Время применения миграции
+    """
+    __tablename__ = "schema_version"
+
+    version = Column(Integer, primary_key=True)
+    description = Column(String, nullable=False)
+    applied_at = Column(DateTime, default=datetime.utcnow)
+
+
+class FsmRecord(Base):
+    """
+    Состояние и данные машины состояний aiogram.
+
+    Args:
+        key: Ключ хранилища (бот, чат, пользователь)
+        state: Текущее состояние
+        data: Данные состояния в формате JSON
+        expires_at: Время, после которого запись считается устаревшей
+    """
+    __tablename__ = "fsm_records"
+
+    key = Column(String, primary_key=True)
+    state = Column(String, nullable=True)
+    data = Column(Text, nullable=False, default="{}")
+    expires_at = Column(DateTime, nullable=True, index=True)
+
+
+class ProcessedPayment(Base):
+    """
+    Зачисленный платёж yookassa.
+
+    Args:
+        payment_id: ID платежа в системе yookassa
+        user_id: ID пользователя, которому зачислен платёж
+        purpose: Назначение платежа: top_up или cart
+        amount: Сумма платежа
+        processed_at: Время зачисления
+    """
+    __tablename__ = "processed_payments"
+
+    payment_id = Column(String, primary_key=True)
+    user_id = Column(Integer, nullable=False, index=True)
+    purpose = Column(String, nullable=False)
+    amount = Column(DECIMAL(10, 2), nullable=False)
+    processed_at = Column(DateTime, default=datetime.utcnow)
+
+
+class ReservedCode(Base):
+    """
+    Уникальный код, зарезервированный пулом кодов.
+
+    Args:
+        code: Код (гифт или реферальный), уникален среди всех кодов
+        kind: Вид кода: gift или referral
+        reserved_at: Время резервирования
+    """
+    __tablename__ = "reserved_codes"
+
+    code = Column(String, primary_key=True)
+    kind = Column(String, nullable=False)
+    reserved_at = Column(DateTime, default=datetime.utcnow)
+
+
+class ProductCode(Base):
+    """
+    Код товара на складе.
+
+    Args:
+        id: ID кода
+        product_id: ID товара
+        code: Сам товар (цифровой код)
+        sold_to: ID пользователя, купившего код
+        sold_at: Время продажи, NULL - код в наличии
+
+        product: Связь с таблицей Product
+    """
+    __tablename__ = "product_codes"
+    __table_args__ = (
+        Index('uq_product_codes_product_id_code', 'product_id', 'code',
+              unique=True),
+        # Покупка выбирает только непроданные коды товара по порядку id
+        Index('ix_product_codes_available', 'product_id', 'id',
+              postgresql_where=text("sold_at IS NULL")),
+    )
+
+    id = Column(Integer, primary_key=True)
+    product_id = Column(Integer, ForeignKey('products.id', ondelete="CASCADE"),
+                        nullable=False)
+    code = Column(String, nullable=False)
+    sold_to = Column(Integer, nullable=True)
+    sold_at = Column(DateTime, nullable=True)
+
+    product = relationship('Product')
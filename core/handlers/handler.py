@@ -1,48 +1,77 @@
 """Модуль обработчиков Aiogram3."""
+import html
 import os
 import logging
 from decimal import Decimal, InvalidOperation
 from aiogram import Router, Bot, types, F
-from aiogram.types import Message
+from aiogram.types import InlineKeyboardMarkup, InputMediaPhoto, Message
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.types.callback_query import CallbackQuery
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
-from core.database.dataTools import (get_all_products, get_user, add_user,
-                                     add_product, increasing_quantity_of_goods,
+from core.database.dataTools import (get_products_page, add_user,
+                                     add_product, add_product_codes,
                                      get_balance, get_referal_code,
                                      top_up_admin, write_off_admin,
                                      delete_item, add_to_cart, get_user_cart,
                                      item_un_cart, get_user_collection_tools,
-                                     add_product_to_users_collection_tools,
-                                     empty_the_basket)
-from core.payment.payment_tools import (check_payment,
-                                        create_payment,
-                                        get_amount_payment)
+                                     checkout_with_balance,
+                                     create_order, fail_order,
+                                     get_cart_shortage,
+                                     apply_payment, get_processed_payment)
+from core.database.cache import catalog_cache, known_users, payment_cache
+from core.database.code_pool import gift_codes, referral_codes
+from core.db_models.models import get_pool_stats
+from core.payment.payment_tools import (create_payment,
+                                        get_payment_info,
+                                        yookassa_client,
+                                        YooKassaError)
+from core.payment.reconciler import start_reconciler, stop_reconciler
+from core.utils.callbacks import (CallbackTable, CatalogPage, ToCart,
+                                  DeleteItem, UnCart, TopUpCheck, CartCheck)
 from core.utils.commands import set_commands
+from core.utils.menu import MenuFilter, MenuRoute, MenuTable
 from core.contents.content import (bot_status, user_menu,
                                    admin_menu, fsm_product)
-from core.keyboards.reply_inline import ReplyKeyBoards, InlineKeyBoards
+from core.keyboards.reply_inline import (InlineKeyBoards, KeyboardMemo,
+                                         keyboards)
 from core.state_models.state import (Product_add, TopUpAdmin,
-                                     WriteOffAdmin, TopUpUser)
-from core.tools.tool import generate_gift
+                                     WriteOffAdmin, TopUpUser, LoadCodes)
+from core.tools.tool import chunked, split_text
 
 
 logger = logging.getLogger(__name__)
 admin_id = int(os.environ.get("ADMIN_ID"))
 router = Router()
+callbacks = CallbackTable()
+menu = MenuTable(admin_id, user_menu, admin_menu)
+# Карточки каталога, сбрасываются при любом изменении каталога
+catalog_cards = KeyboardMemo(version=lambda: catalog_cache.version)
+
+# Количество товаров на одной карточке карусели каталога
+CATALOG_PAGE_SIZE = 1
+# Максимальный размер альбома в Telegram
+MEDIA_GROUP_SIZE = 10
+# Начиная с этого количества товары выводятся текстом без фото
+COMPACT_VIEW_THRESHOLD = 30
+# Допустимая сумма платежа (суммы в заказах - DECIMAL(10, 2))
+PAYMENT_MIN = Decimal("0.01")
+PAYMENT_MAX = Decimal("99999999.99")
 
 
 async def start_bot(bot: Bot) -> None:
     """Отправляет пользователю сообщение о старте бота."""
     await set_commands(bot)
+    start_reconciler(bot)
     await bot.send_message(admin_id, text=bot_status[1])
     logger.info(bot_status[1])
 
 
 async def stop_bot(bot: Bot) -> None:
     """Отправляет пользователю сообщение об остановке бота."""
+    await stop_reconciler()
+    await yookassa_client.close()
     await bot.send_message(admin_id, text=bot_status[2])
     logger.info(bot_status[2])
 
@@ -51,72 +80,77 @@ async def stop_bot(bot: Bot) -> None:
 async def get_start(message: Message) -> None:
     """Обработчик команды /start"""
     user_id = message.from_user.id
-    result = await get_user(user_id=user_id)
-    if result is None:
-        user = await add_user(user_id=user_id)
-        await message.answer(text=user)
-    if user_id == admin_id:
-        await message.answer(
-            f"Привет <b>{message.from_user.first_name}</b>!",
-            reply_markup=ReplyKeyBoards.create_keyboard_reply(admin_menu[7],
-                                                              user_menu[1],
-                                                              user_menu[2],
-                                                              user_menu[3],
-                                                              user_menu[11],
-                                                              user_menu[5],
-                                                              user_menu[9]))
-    else:
-        await message.answer(
-            f"Привет <b>{message.from_user.first_name}</b>!",
-            reply_markup=ReplyKeyBoards.create_keyboard_reply(user_menu[1],
-                                                              user_menu[2],
-                                                              user_menu[3],
-                                                              user_menu[11],
-                                                              user_menu[5],
-                                                              user_menu[9]))
+    ref_code = await add_user(user_id=user_id)
+    if ref_code is not None:
+        await message.answer(text=ref_code)
+    await message.answer(
+        f"Привет <b>{message.from_user.first_name}</b>!",
+        reply_markup=keyboards.get("main", user_role(user_id)))
+
+
+@router.message(Command("stats"), F.from_user.id == admin_id)
+async def get_stats(message: Message) -> None:
+    """Статистика пула соединений и кэшей."""
+    sections = {
+        "Пул соединений БД": get_pool_stats(),
+        "Кэш каталога": catalog_cache.stats(),
+        "Известные пользователи": known_users.stats(),
+        "Статусы платежей": payment_cache.stats(),
+        "Пул гифт-кодов": gift_codes.stats(),
+        "Пул реферальных кодов": referral_codes.stats(),
+        "Меню": menu.stats(),
+        "Inline-кнопки": callbacks.hits,
+    }
+    text = "\n\n".join(
+        f"<b>{title}</b>\n" + "\n".join(
+            f"{key}: {value}" for key, value in stats.items())
+        for title, stats in sections.items())
+    await message.answer(text)
+
+
+@router.message(MenuFilter(menu))
+async def dispatch_menu(message: Message, state: FSMContext,
+                        menu_route: MenuRoute) -> None:
+    """
+    Единая точка входа кнопок reply-меню.
+
+    Notes:
+
+        Зарегистрирован до обработчиков состояний: кнопки
+        навигации (any_state) срабатывают в любом состоянии.
+        Остальные кнопки перебивают только состояния из своих
+        states - те, чьи обработчики раньше регистрировались
+        после кнопки, - и уступают прочим, как и раньше.
+    """
+    await menu.dispatch(message, state, menu_route)
 
 
-@router.message(F.text == admin_menu[7], F.from_user.id == admin_id)
+@menu.route(admin_menu[7], admin_only=True, any_state=True)
 async def moder_menu(message: Message) -> None:
     """Админ меню."""
     await message.answer(
             f"Привет <b>{message.from_user.first_name}</b>!",
-            reply_markup=ReplyKeyBoards.create_keyboard_reply(admin_menu[1],
-                                                              admin_menu[3],
-                                                              admin_menu[4],
-                                                              admin_menu[5],
-                                                              admin_menu[8]
-                                                              ))
+            reply_markup=keyboards.get("moder", "admin"))
 
 
-@router.message(F.text == admin_menu[8])
-async def backward(message: Message) -> None:
-    """Обработка кнопки  'НАЗАД' - возвращает в главное меню."""
+@menu.route(admin_menu[8], any_state=True)
+async def backward(message: Message, state: FSMContext) -> None:
+    """
+    Обработка кнопки  'НАЗАД' - возвращает в главное меню.
+
+    Notes:
+
+        Сбрасывает состояние FSM, чтобы из любой формы можно
+        было выйти, не вводя ожидаемое значение.
+    """
+    await state.clear()
     user_id = message.from_user.id
-    if user_id == admin_id:
-        await message.answer(
-            text="Вы в меню!",
-            reply_markup=ReplyKeyBoards.create_keyboard_reply(
-                admin_menu[7],
-                user_menu[1],
-                user_menu[2],
-                user_menu[3],
-                user_menu[11],
-                user_menu[5],
-                user_menu[9],))
-    else:
-        await message.answer(
-            text="Вы в меню!",
-            reply_markup=ReplyKeyBoards.create_keyboard_reply(
-                user_menu[1],
-                user_menu[2],
-                user_menu[3],
-                user_menu[11],
-                user_menu[5],
-                user_menu[9]))
+    await message.answer(
+        text="Вы в меню!",
+        reply_markup=keyboards.get("main", user_role(user_id)))
 
 
-@router.message(F.text == admin_menu[1], F.from_user.id == admin_id)
+@menu.route(admin_menu[1], admin_only=True, any_state=True)
 async def add_product_start(message: Message, state: FSMContext) -> None:
     """
     Добавление продукта (FSM) в БД. Указание названия.
@@ -196,36 +230,37 @@ async def add_product_photo_db(message: Message, state: FSMContext) -> None:
     Notes:
 
         Получает ID фото с системе, собирает данные из машины состояний,
-        добавляет товар в базу, увеличивает кол-во товара на 'складе'(в базе),
+        добавляет товар в базу с нулевым остатком (остаток - это
+        загруженные кнопкой "ЗАГРУЗИТЬ КОДЫ" коды товара),
         возвращает сообщение об успехе или ошибке добавления
     """
     file_id = message.photo[-1].file_id
     data: dict = await state.get_data()
-    result = await add_product(name=data['name'],
-                               description=data['description'],
-                               price=data['price'],
-                               photo_id=file_id)
-    amount = await increasing_quantity_of_goods(name=data['name'])
-    if amount:
-        await message.answer(text=result)
+    product_id = await add_product(name=data['name'],
+                                   description=data['description'],
+                                   price=data['price'],
+                                   photo_id=file_id)
+    if product_id is not None:
+        await message.answer(text=fsm_product[5])
         await state.clear()
     else:
         await message.answer(text=fsm_product[6])
         await state.clear()
 
 
-@router.message(F.text == user_menu[3])
+@menu.route(user_menu[3],
+            states=(TopUpUser, TopUpAdmin, WriteOffAdmin, LoadCodes))
 async def get_user_balance(message: Message) -> None:
     """Получение баланса пользователя."""
     user_id = message.from_user.id
     balance = await get_balance(user_id=user_id)
     await message.answer(
         text=f"Ваш баланс: {str(balance)} р.",
-        reply_markup=ReplyKeyBoards.create_keyboard_reply(user_menu[13],
-                                                          admin_menu[8]))
+        reply_markup=keyboards.get("balance"))
 
 
-@router.message(F.text == user_menu[13])
+@menu.route(user_menu[13],
+            states=(TopUpUser, TopUpAdmin, WriteOffAdmin, LoadCodes))
 async def top_up_user_one(message: Message,
                           state: FSMContext) -> None:
     """Пополнение баланса пользователя - ввод суммы."""
@@ -233,23 +268,40 @@ async def top_up_user_one(message: Message,
     await message.answer(fsm_product[8])
 
 
+def valid_payment_amount(value: Decimal) -> bool:
+    """Сумма конечна, в допустимом диапазоне и не мельче копейки."""
+    return (value.is_finite() and PAYMENT_MIN <= value <= PAYMENT_MAX and
+            value == value.quantize(PAYMENT_MIN))
+
+
 @router.message(TopUpUser.amount)
 async def top_up_user_two(message: Message,
                           state: FSMContext) -> None:
     """Пополнение баланса пользователя - формирование транзакции."""
-    await state.update_data(amount=message.text)
     user_id = message.chat.id
-    user_amount = message.text
+    user_amount = message.text or ""
     try:
         value = Decimal(user_amount)
     except (ValueError, InvalidOperation):
         await message.answer(fsm_product[14])
         return
+    if not valid_payment_amount(value):
+        await message.answer(fsm_product[19])
+        return
     await state.update_data(amount=value)
     data: dict = await state.get_data()
 
-    pyment_url, payment_id = await create_payment(data['amount'], user_id,
-                                                  "Пополнение баланса...")
+    order_id, amount = await create_order(user_id=user_id, purpose="top_up",
+                                          amount=data['amount'])
+    try:
+        pyment_url, payment_id = await create_payment(
+            order_id, amount, user_id, "Пополнение баланса...",
+            purpose="top_up")
+    except YooKassaError as ex:
+        logger.debug(f"Ошибка создания платежа {ex}")
+        await message.answer(fsm_product[20])
+        await state.clear()
+        return
 
     builder = InlineKeyboardBuilder()
     builder.add(types.InlineKeyboardButton(
@@ -258,32 +310,62 @@ async def top_up_user_two(message: Message,
     ))
     builder.add(types.InlineKeyboardButton(
         text="Проверить оплату",
-        callback_data=f"check_{payment_id}"
+        callback_data=TopUpCheck(payment_id=payment_id).pack()
     ))
     await message.answer("Счёт сформирован...",
                          reply_markup=builder.as_markup())
     await state.clear()
 
 
-@router.callback_query(lambda c: 'check' in c.data)
-async def top_up_user_three(callback: types.CallbackQuery) -> None:
-    payment_id = callback.data.split("_")[-1]
-    user_id = callback.message.chat.id
-    result = await check_payment(payment_id)
-    if result:
-        amount = await get_amount_payment(payment_id=payment_id)
-        user = await top_up_admin(user_id=user_id, amount=amount)
-        await callback.message.answer(
-            text=user,
-            reply_markup=ReplyKeyBoards.create_keyboard_reply(
-                user_menu[13],
-                admin_menu[8]))
-    else:
-        await callback.message.answer(
-            "Оплата ещё не прошла или возникла ошибка!")
-
-
-@router.message(F.text == user_menu[4])
+async def confirm_payment(payment_id: str, user_id: int,
+                          purpose: str) -> str:
+    """
+    Проверка оплаты по кнопке "Проверить оплату".
+
+    Args:
+        payment_id: ID платежа в системе yookassa
+        user_id: ID пользователя, нажавшего кнопку
+        purpose: Назначение платежа, если его нет в метаданных
+
+    Returns:
+        Сначала смотрит локальный статус в processed_payments:
+        платёж, уже зачисленный по уведомлению yookassa, не
+        требует обращения к платёжной системе. Иначе проверяет
+        платёж в yookassa (ответ кэшируется, повторные нажатия
+        не уходят в платёжную систему) и зачисляет его через
+        apply_payment, которая не даст зачислить платёж повторно.
+    """
+    if await get_processed_payment(payment_id) is not None:
+        return "Платёж уже зачислен!"
+    try:
+        info = await get_payment_info(payment_id)
+    except YooKassaError as ex:
+        logger.debug(f"Ошибка проверки платежа {ex}")
+        return "Оплата ещё не прошла или возникла ошибка!"
+    if not info.paid:
+        return "Оплата ещё не прошла или возникла ошибка!"
+    message = await apply_payment(
+        payment_id=payment_id,
+        user_id=int(info.metadata.get("chat_id", user_id)),
+        purpose=info.metadata.get("purpose", purpose),
+        amount=info.amount)
+    return message or "Платёж уже зачислен!"
+
+
+@callbacks.route(TopUpCheck)
+async def top_up_user_three(callback: CallbackQuery,
+                            callback_data: TopUpCheck) -> None:
+    """Пополнение баланса пользователя - проверка статуса платежа."""
+    result = await confirm_payment(payment_id=callback_data.payment_id,
+                                   user_id=callback.message.chat.id,
+                                   purpose="top_up")
+    await callback.message.answer(
+        text=result,
+        reply_markup=keyboards.get("balance"))
+
+
+@menu.route(user_menu[4],
+            states=(TopUpAdmin, WriteOffAdmin, LoadCodes))
 async def get_referal(message: Message) -> None:
     """
     Получение реферального кода, просмотр рефералов.
@@ -301,27 +383,31 @@ async def get_referal(message: Message) -> None:
         await message.answer(text=ref_code)
 
 
-@router.message(F.text == user_menu[5])
+@menu.route(user_menu[5],
+            states=(TopUpAdmin, WriteOffAdmin, LoadCodes))
 async def get_contacts(message: Message) -> None:
     """Получение контактов, для связи с операторами и админами."""
     await message.answer(f"Администратор: {user_menu[8]}")
 
 
-@router.message(F.text == user_menu[9])
+@menu.route(user_menu[9],
+            states=(TopUpAdmin, WriteOffAdmin, LoadCodes))
 async def get_my_id(message: Message) -> None:
     """Получение своего ID."""
     user_id = message.from_user.id
     await message.answer(f"Ваш ID: {user_id}")
 
 
-@router.message(F.text == admin_menu[3], F.from_user.id == admin_id)
+@menu.route(admin_menu[3], admin_only=True,
+            states=(TopUpAdmin, WriteOffAdmin, LoadCodes))
 async def make_gift(message: Message) -> None:
     """Генерация рандомного гифт-ключа."""
-    gift = await generate_gift()
+    gift = await gift_codes.take_one()
     await message.answer(F"Вот гифт-ключ: {gift}")
 
 
-@router.message(F.text == admin_menu[4], F.from_user.id == admin_id)
+@menu.route(admin_menu[4], admin_only=True,
+            states=(TopUpAdmin, WriteOffAdmin, LoadCodes))
 async def top_up_start(message: Message, state: FSMContext) -> None:
     """Ручное пополнение баланса (FSM). Указание ID пользователя."""
     await state.set_state(TopUpAdmin.user_id)
@@ -361,7 +447,8 @@ async def top_up_amount(message: Message, state: FSMContext) -> None:
     await state.clear()
 
 
-@router.message(F.text == admin_menu[5], F.from_user.id == admin_id)
+@menu.route(admin_menu[5], admin_only=True,
+            states=(WriteOffAdmin, LoadCodes))
 async def write_off_start(message: Message, state: FSMContext) -> None:
     """Ручное списание средств (FSM). Указание ID пользователя."""
     await state.set_state(WriteOffAdmin.user_id)
@@ -399,153 +486,291 @@ async def write_off_amount(message: Message, state: FSMContext) -> None:
     await state.clear()
 
 
-@router.message(F.text == user_menu[1])
+@menu.route(admin_menu[10], admin_only=True, states=(LoadCodes,))
+async def load_codes_start(message: Message, state: FSMContext) -> None:
+    """Загрузка кодов товара (FSM). Указание ID товара."""
+    await state.set_state(LoadCodes.product_id)
+    await message.answer(fsm_product[16])
+
+
+@router.message(LoadCodes.product_id, F.from_user.id == admin_id)
+async def load_codes_product(message: Message, state: FSMContext) -> None:
+    """Загрузка кодов товара (FSM). Ввод кодов."""
+    product = message.text
+    if product is None or not product.isdigit():
+        await message.answer(fsm_product[13])
+        return
+
+    await state.update_data(product_id=int(product))
+    await state.set_state(LoadCodes.codes)
+    await message.answer(fsm_product[17])
+
+
+@router.message(LoadCodes.codes, F.from_user.id == admin_id)
+async def load_codes_finish(message: Message, state: FSMContext) -> None:
+    """
+    Загрузка кодов товара (FSM). Запись кодов на склад.
+
+    Notes:
+
+        Уже загруженные коды товара пропускаются, остаток
+        товара увеличивается на количество новых кодов.
+        Кнопки меню перебивают это состояние (states=LoadCodes
+        у их маршрутов), поэтому их текст не попадает в коды.
+    """
+    data: dict = await state.get_data()
+    added = await add_product_codes(
+        product_id=data['product_id'],
+        codes=(message.text or "").splitlines())
+    if added is None:
+        await message.answer(fsm_product[18])
+    else:
+        await message.answer(f"Загружено кодов: {added}")
+    await state.clear()
+
+
+def user_role(user_id: int) -> str:
+    """Роль пользователя для выбора клавиатуры."""
+    return "admin" if user_id == admin_id else "user"
+
+
+def catalog_card(item: dict, user_id: int, has_prev: bool,
+                 has_next: bool) -> tuple[str, InlineKeyboardMarkup]:
+    """
+    Подпись и клавиатура карточки товара в карусели каталога.
+
+    Notes:
+
+        Тексты товара экранируются: подписи уходят с parse_mode HTML.
+        Карточка собирается один раз на товар, роль и соседей
+        и берётся из catalog_cards, пока каталог не изменится.
+        У товара без остатка нет кнопки "В КОРЗИНУ".
+    """
+    is_admin = user_id == admin_id
+
+    def build() -> tuple[str, InlineKeyboardMarkup]:
+        text = (
+            f"Название: {html.escape(item['name'])}\n"
+            f"Описание: {html.escape(item['description'] or '')}\n"
+            f"Цена: {item['price']} руб."
+        )
+        buttons = []
+        if item['is_stock']:
+            buttons.append((user_menu[6],
+                            ToCart(product_id=item['id']).pack()))
+        else:
+            text += "\nНет в наличии"
+        if is_admin:
+            text += f"\nID: {item['id']}\nНа складе: {item['amount']} шт."
+            buttons.append((admin_menu[2],
+                            DeleteItem(product_id=item['id']).pack()))
+        navigation = []
+        if has_prev:
+            navigation.append((user_menu[14], CatalogPage(
+                backward=True, cursor=item['id']).pack()))
+        if has_next:
+            navigation.append((user_menu[15], CatalogPage(
+                backward=False, cursor=item['id']).pack()))
+        return text, InlineKeyBoards.create_keyboard_carousel(
+            buttons, navigation).as_markup()
+
+    return catalog_cards.get_or_build(
+        (item['id'], is_admin, has_prev, has_next), build)
+
+
+@menu.route(user_menu[1], states=(LoadCodes,))
 async def catalog(message: Message) -> None:
-    """Получение всех товаров в каталоге."""
+    """Каталог товаров - первая карточка карусели."""
     user_id = message.from_user.id
-    products = await get_all_products()
+    products, has_prev, has_next = await get_products_page(
+        limit=CATALOG_PAGE_SIZE)
     if products:
-        for item in products:
-            text = (
-                f"Название: {item['name']}\n"
-                f"Описание: {item['description']}\n"
-                f"Цена: {item['price']} руб."
-            )
-            if user_id == admin_id:
-                buttons = [
-                    (user_menu[6], f"to_cart:{item['id']}"),
-                    (admin_menu[2], f"delete_item:{item['id']}")
-                ]
-                await message.answer_photo(
-                    photo=item['photo_id'],
-                    caption=text,
-                    reply_markup=InlineKeyBoards.create_keyboard_inline(
-                        buttons).as_markup())
-            else:
-                buttons = [
-                    (user_menu[6], f"to_cart:{item['id']}")
-                    ]
-                await message.answer_photo(
-                    photo=item['photo_id'],
-                    caption=text,
-                    reply_markup=InlineKeyBoards.create_keyboard_inline(
-                        buttons).as_markup())
+        item = products[0]
+        text, keyboard = catalog_card(item, user_id, has_prev, has_next)
+        await message.answer_photo(
+            photo=item['photo_id'],
+            caption=text,
+            reply_markup=keyboard)
     else:
         await message.answer("Товары отсутствуют в базе данных!")
 
 
-@router.callback_query(F.data.startswith("delete_item:"))
-async def delete_one_item(callback: CallbackQuery) -> None:
+@callbacks.route(CatalogPage)
+async def catalog_page(callback: CallbackQuery,
+                       callback_data: CatalogPage) -> None:
+    """Листание карусели каталога - замена фото и подписи."""
+    user_id = callback.from_user.id
+    products, has_prev, has_next = await get_products_page(
+        cursor=callback_data.cursor,
+        limit=CATALOG_PAGE_SIZE,
+        backward=callback_data.backward)
+    if not products:
+        await callback.answer("Больше товаров нет!")
+        return
+    item = products[0]
+    text, keyboard = catalog_card(item, user_id, has_prev, has_next)
+    await callback.message.edit_media(
+        media=InputMediaPhoto(media=item['photo_id'], caption=text),
+        reply_markup=keyboard)
+    await callback.answer()
+
+
+@callbacks.route(DeleteItem)
+async def delete_one_item(callback: CallbackQuery,
+                          callback_data: DeleteItem) -> None:
     """Удаление товара из каталога."""
-    item_id = callback.data.split(":")[1]
-    result = await delete_item(item_id=int(item_id))
+    if callback.from_user.id != admin_id:
+        await callback.answer()
+        return
+    result = await delete_item(item_id=callback_data.product_id)
     await callback.message.edit_caption(caption=result)
 
 
-@router.callback_query(F.data.startswith("to_cart:"))
-async def item_to_cart(callback: CallbackQuery) -> None:
+@callbacks.route(ToCart)
+async def item_to_cart(callback: CallbackQuery,
+                       callback_data: ToCart) -> None:
     """Добавление товаров в корзину."""
-    product_id = callback.data.split(":")[1]
     user_id = callback.from_user.id
     result = await add_to_cart(user_id=user_id,
-                               product_id=int(product_id))
-    await callback.message.edit_caption(caption=result)
+                               product_id=callback_data.product_id)
+    await callback.answer(text=result)
+
+
+async def send_gallery(message: Message,
+                       photos: list[tuple[str, str]]) -> None:
+    """
+    Отправка фото с подписями альбомами по 10 штук.
+
+    Notes:
+
+        Альбом из одного фото Telegram не принимает,
+        такой остаток отправляется обычным фото.
+    """
+    for chunk in chunked(photos, MEDIA_GROUP_SIZE):
+        if len(chunk) == 1:
+            photo, caption = chunk[0]
+            await message.answer_photo(photo=photo, caption=caption)
+        else:
+            await message.answer_media_group(media=[
+                InputMediaPhoto(media=photo, caption=caption)
+                for photo, caption in chunk])
 
 
-@router.message(F.text == user_menu[2])
+async def send_text_list(message: Message, lines: list[str]) -> None:
+    """Компактный вывод без фото - длинные списки одним-двумя текстами."""
+    for text in split_text(lines):
+        await message.answer(text=text)
+
+
+@menu.route(user_menu[2], states=(LoadCodes,))
 async def get_cart(message: Message) -> None:
     """Получение корзины пользователя."""
     user_id = message.from_user.id
-    products = await get_user_cart(user_id=user_id)
-    if products:
-        for product in products:
-            text = (
-                f"id: {product.id}\n"
-                f"Название: {product.product_name}\n"
-                f"Описание: {product.description}\n"
-                f"Цена: {product.price} рублей."
-            )
-            buttons = [
-                    (user_menu[7], f"un-cart:{product.id}"),
-            ]
-            await message.answer_photo(
-                photo=product.photo_id,
-                caption=text,
-                reply_markup=InlineKeyBoards.create_keyboard_inline(
-                    buttons).as_markup())
+    lines = await get_user_cart(user_id=user_id)
+    if lines:
+        if len(lines) > COMPACT_VIEW_THRESHOLD:
+            await send_text_list(message, [
+                f"{product.id}. {html.escape(product.product_name)} - "
+                f"{product.price} руб. x {quantity}"
+                for product, quantity in lines])
+        else:
+            await send_gallery(message, [
+                (product.photo_id,
+                 f"id: {product.id}\n"
+                 f"Название: {html.escape(product.product_name)}\n"
+                 f"Описание: {html.escape(product.description or '')}\n"
+                 f"Цена: {product.price} рублей.\n"
+                 f"Количество: {quantity} шт.")
+                for product, quantity in lines])
+        buttons = [(f"{user_menu[7]} {product.product_name}",
+                    UnCart(product_id=product.id).pack())
+                   for product, _ in lines]
+        total = sum(product.price * quantity for product, quantity in lines)
+        await message.answer(
+            text=f"Итого: {total} руб.",
+            reply_markup=InlineKeyBoards.create_keyboard_inline(
+                buttons).as_markup())
         await message.answer(text="Выберите действие...",
-                             reply_markup=ReplyKeyBoards.create_keyboard_reply(
-                                 user_menu[10],
-                                 user_menu[12],
-                                 admin_menu[8]
-                                 ))
+                             reply_markup=keyboards.get("cart"))
     else:
         await message.answer("Корзина пуста!")
 
 
-@router.callback_query(F.data.startswith("un-cart:"))
-async def un_cart(callback: CallbackQuery) -> None:
+@callbacks.route(UnCart)
+async def un_cart(callback: CallbackQuery,
+                  callback_data: UnCart) -> None:
     """Удаление товара из корзины."""
-    product_id = callback.data.split(":")[1]
     user_id = callback.from_user.id
     result = await item_un_cart(user_id=user_id,
-                                product_id=int(product_id))
-    await callback.message.edit_caption(caption=result)
+                                product_id=callback_data.product_id)
+    await callback.answer(text=result)
 
 
-@router.message(F.text == user_menu[11])
+@menu.route(user_menu[11], states=(LoadCodes,))
 async def get_user_collection(message: Message) -> None:
     """Получение пользователем его купленных товаров."""
     user_id = message.from_user.id
     products = await get_user_collection_tools(user_id=user_id)
     if products:
-        for item in products:
-            text = (
-                f"Название: {item.product_name}\n"
-                f"Цийровой код: {item.product_code}"
-            )
-            await message.answer_photo(
-                photo=item.photo_id,
-                caption=text)
+        if len(products) > COMPACT_VIEW_THRESHOLD:
+            await send_text_list(message, [
+                f"{html.escape(item.product_name)}: "
+                f"<code>{html.escape(item.product_code)}</code>"
+                for item in products])
+        else:
+            await send_gallery(message, [
+                (item.photo_id,
+                 f"Название: {html.escape(item.product_name)}\n"
+                 f"Цийровой код: {html.escape(item.product_code)}")
+                for item in products])
     else:
         await message.answer("Вы ещё не купили товары (((")
 
 
-@router.message(F.text == user_menu[10])
+@menu.route(user_menu[10], states=(LoadCodes,))
 async def balance_payment(message: Message) -> None:
     """Оплата через баланс."""
     user_id = message.from_user.id
-    cart_products = await get_user_cart(user_id=user_id)
-    user_balance = await get_balance(user_id=user_id)
-    amount = 0
-    for item in cart_products:
-        amount += item.price
-    if float(user_balance) >= float(amount):
-        for item in cart_products:
-            await add_product_to_users_collection_tools(
-                user_id=user_id,
-                product_name=item.product_name,
-                product_code=await generate_gift(),
-                photo_id=item.photo_id)
-        await empty_the_basket(user_id=user_id)
-        await write_off_admin(user_id=user_id, amount=amount)
-        await message.answer(
-            "Успешно, товары вы найдете в разделе 'МОИ ТОВАРЫ'.")
-    else:
-        await message.answer("На баалнсе недостаточно средств...")
+    result = await checkout_with_balance(user_id=user_id)
+    await message.answer(text=result)
 
 
-@router.message(F.text == user_menu[12])
+@menu.route(user_menu[12], states=(LoadCodes,))
 async def card_payment(message: Message) -> None:
-    """Оплата картой - формирование платежа."""
+    """
+    Оплата картой - формирование платежа.
+
+    Notes:
+
+        Сначала корзина копируется в заказ, и счёт выставляется
+        на сумму этой копии: товары, добавленные в корзину, пока
+        создаётся платёж, в счёт не попадут.
+    """
     user_id = message.chat.id
-    cart_products = await get_user_cart(user_id=user_id)
-    amount = 0
-    for item in cart_products:
-        amount += item.price
+    shortage = await get_cart_shortage(user_id=user_id)
+    if shortage:
+        await message.answer("Недостаточно товара на складе: " +
+                             ", ".join(shortage))
+        return
+    order = await create_order(user_id=user_id, purpose="cart")
+    if order is None:
+        await message.answer("Корзина пуста!")
+        return
+    order_id, amount = order
+    if not valid_payment_amount(amount):
+        await fail_order(order_id)
+        await message.answer(fsm_product[19])
+        return
 
-    pyment_url, payment_id = await create_payment(amount, user_id,
-                                                  "Оплата корзины...")
+    try:
+        pyment_url, payment_id = await create_payment(order_id, amount,
+                                                      user_id,
+                                                      "Оплата корзины...",
+                                                      purpose="cart")
+    except YooKassaError as ex:
+        logger.debug(f"Ошибка создания платежа {ex}")
+        await message.answer(fsm_product[20])
+        return
     builder = InlineKeyboardBuilder()
     builder.add(types.InlineKeyboardButton(
         text="Оплатить",
@@ -553,29 +778,24 @@ async def card_payment(message: Message) -> None:
     ))
     builder.add(types.InlineKeyboardButton(
         text="Проверить оплату",
-        callback_data=f"check_{payment_id}"
+        callback_data=CartCheck(payment_id=payment_id).pack()
     ))
 
     await message.answer("Счёт сформирован...",
                          reply_markup=builder.as_markup())
 
 
-@router.callback_query(lambda c: 'check' in c.data)
-async def check_card_payment(callback: types.CallbackQuery) -> None:
+@callbacks.route(CartCheck)
+async def check_card_payment(callback: CallbackQuery,
+                             callback_data: CartCheck) -> None:
     """Оплата картой - обработка платежа, проверка статуса платежа."""
-    user_id = callback.message.chat.id
-    result = await check_payment(callback.data.split("_")[-1])
-    if result:
-        cart_products = await get_user_cart(user_id=user_id)
-        for item in cart_products:
-            await add_product_to_users_collection_tools(
-                user_id=user_id,
-                product_name=item.product_name,
-                product_code=await generate_gift(),
-                photo_id=item.photo_id)
-        await empty_the_basket(user_id=user_id)
-        await callback.message.answer(
-            "Успешно, товары вы найдете в разделе 'МОИ ТОВАРЫ'.")
-    else:
-        await callback.message.answer(
-            "Оплата ещё не прошла или возникла ошибка!")
+    result = await confirm_payment(payment_id=callback_data.payment_id,
+                                   user_id=callback.message.chat.id,
+                                   purpose="cart")
+    await callback.message.answer(result)
+
+
+@router.callback_query()
+async def dispatch_callback(callback: CallbackQuery) -> None:
+    """Единая точка входа inline-кнопок - маршрутизация по префиксу."""
+    await callbacks.dispatch(callback)
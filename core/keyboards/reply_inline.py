@@ -1,62 +1,175 @@
-"""
-Модуль с инструментами по созданию Reply и Inline клавиатур.
-
-classes:
-    ReplyKeyBoards: Класс для создание Reply клавиатуры.
-    InlineKeyBoards: Класс для создание Inline клавиатуры.
-"""
-import logging
-from aiogram.types import (InlineKeyboardMarkup,
-                           InlineKeyboardButton,
-                           ReplyKeyboardMarkup)
-from aiogram.utils.keyboard import InlineKeyboardBuilder
-from aiogram import types
-
-
-logger = logging.getLogger(__name__)
-
-
-class ReplyKeyBoards:
-    """Класс для работы с Reply клавиатурой."""
-
-    def __init__(self):
-        """Метод инициализации класса."""
-        pass
-
-    @staticmethod
-    def create_keyboard_reply(*buttons: str) -> ReplyKeyboardMarkup:
-        """
-        Метод создаёт клавиатуру с предаными кнопопками.
-
-        params:
-            buttons: кнопки в формате строки: '1_КНОПКА_1'
-        """
-        kb: list = [[types.KeyboardButton(text=button)] for button in buttons]
-        keyboard = types.ReplyKeyboardMarkup(
-                keyboard=kb,
-                resize_keyboard=True,
-            )
-        return keyboard
-
-
-class InlineKeyBoards:
-    """Класс для работы с Inline клавиатурой."""
-
-    @staticmethod
-    def create_keyboard_inline(buttons) -> InlineKeyboardMarkup:
-        """
-        Метод создает клавиатуру с заданными кнопками.
-
-        params:
-            buttons: список кортежей, где каждый кортеж — это
-            ('название кнопки', 'callback метка').
-
-        returns:
-            InlineKeyboardMarkup с кнопками.
-        """
-        builder = InlineKeyboardBuilder()
-        for text, callback in buttons:
-            builder.row(types.InlineKeyboardButton(
-                text=text, callback_data=callback
-            ))
-        return builder
+"""
+Модуль с инструментами по созданию Reply и Inline клавиатур.
+
+classes:
+    ReplyKeyBoards: Класс для создание Reply клавиатуры.
+    InlineKeyBoards: Класс для создание Inline клавиатуры.
+    KeyboardRegistry: Готовые Reply клавиатуры по роли и экрану.
+    KeyboardMemo: Кэш Inline клавиатур со сбросом по версии данных.
+
+Args:
+    keyboards: Reply клавиатуры меню бота
+"""
+import logging
+from typing import Any, Callable, Hashable
+from aiogram.types import (InlineKeyboardMarkup,
+                           InlineKeyboardButton,
+                           ReplyKeyboardMarkup)
+from aiogram.utils.keyboard import InlineKeyboardBuilder
+from aiogram import types
+
+from core.contents.content import user_menu, admin_menu
+
+
+logger = logging.getLogger(__name__)
+
+
+class ReplyKeyBoards:
+    """Класс для работы с Reply клавиатурой."""
+
+    def __init__(self):
+        """Метод инициализации класса."""
+        pass
+
+    @staticmethod
+    def create_keyboard_reply(*buttons: str) -> ReplyKeyboardMarkup:
+        """
+        Метод создаёт клавиатуру с предаными кнопопками.
+
+        params:
+            buttons: кнопки в формате строки: '1_КНОПКА_1'
+        """
+        kb: list = [[types.KeyboardButton(text=button)] for button in buttons]
+        keyboard = types.ReplyKeyboardMarkup(
+                keyboard=kb,
+                resize_keyboard=True,
+            )
+        return keyboard
+
+
+class InlineKeyBoards:
+    """Класс для работы с Inline клавиатурой."""
+
+    @staticmethod
+    def create_keyboard_inline(buttons) -> InlineKeyboardMarkup:
+        """
+        Метод создает клавиатуру с заданными кнопками.
+
+        params:
+            buttons: список кортежей, где каждый кортеж — это
+            ('название кнопки', 'callback метка').
+
+        returns:
+            InlineKeyboardMarkup с кнопками.
+        """
+        builder = InlineKeyboardBuilder()
+        for text, callback in buttons:
+            builder.row(types.InlineKeyboardButton(
+                text=text, callback_data=callback
+            ))
+        return builder
+
+    @staticmethod
+    def create_keyboard_carousel(buttons,
+                                 navigation) -> InlineKeyboardBuilder:
+        """
+        Метод создает клавиатуру карусели с кнопками навигации.
+
+        params:
+            buttons: список кортежей ('название кнопки', 'callback метка'),
+            каждая кнопка в отдельном ряду.
+            navigation: список кортежей того же формата,
+            выводятся одним рядом внизу клавиатуры.
+
+        returns:
+            InlineKeyboardBuilder с кнопками.
+        """
+        builder = InlineKeyBoards.create_keyboard_inline(buttons)
+        if navigation:
+            builder.row(*[types.InlineKeyboardButton(
+                text=text, callback_data=callback
+            ) for text, callback in navigation])
+        return builder
+
+
+class KeyboardRegistry:
+    """
+    Готовые Reply клавиатуры по роли и экрану.
+
+    Notes:
+
+        Клавиатуры собираются один раз при импорте модуля.
+        Объекты aiogram неизменяемы, поэтому одна клавиатура
+        отправляется всем пользователям без копирования.
+        Экран, не заданный для роли, берётся у роли user.
+    """
+
+    def __init__(self):
+        """Метод инициализации класса."""
+        self._keyboards: dict[tuple[str, str], ReplyKeyboardMarkup] = {}
+
+    def register(self, role: str, screen: str, *buttons: str) -> None:
+        """
+        Сборка и сохранение клавиатуры экрана.
+
+        params:
+            role: роль пользователя: user или admin.
+            screen: название экрана.
+            buttons: тексты кнопок сверху вниз.
+        """
+        self._keyboards[(role, screen)] = (
+            ReplyKeyBoards.create_keyboard_reply(*buttons))
+
+    def get(self, screen: str, role: str = "user") -> ReplyKeyboardMarkup:
+        """Клавиатура экрана для роли."""
+        keyboard = self._keyboards.get((role, screen))
+        if keyboard is None:
+            keyboard = self._keyboards[("user", screen)]
+        return keyboard
+
+
+class KeyboardMemo:
+    """
+    Кэш Inline клавиатур со сбросом по версии данных.
+
+    Notes:
+
+        При каждом обращении сравнивает версию источника
+        (например, catalog_cache.version) с версией, при которой
+        собраны клавиатуры, и при расхождении очищает кэш.
+        Размер кэша ограничен max_size, при переполнении
+        он очищается целиком.
+    """
+
+    def __init__(self, version: Callable[[], int], max_size: int = 1024):
+        """Метод инициализации класса."""
+        self.version = version
+        self.max_size = max_size
+        self._version = version()
+        self._items: dict[Hashable, Any] = {}
+
+    def get_or_build(self, key: Hashable, build: Callable[[], Any]) -> Any:
+        """Готовое значение по ключу или собранное build()."""
+        version = self.version()
+        if version != self._version or len(self._items) >= self.max_size:
+            self._items.clear()
+            self._version = version
+        value = self._items.get(key)
+        if value is None:
+            value = self._items[key] = build()
+        return value
+
+
+keyboards = KeyboardRegistry()
+keyboards.register("user", "main",
+                   user_menu[1], user_menu[2], user_menu[3],
+                   user_menu[11], user_menu[5], user_menu[9])
+keyboards.register("admin", "main",
+                   admin_menu[7], user_menu[1], user_menu[2], user_menu[3],
+                   user_menu[11], user_menu[5], user_menu[9])
+keyboards.register("admin", "moder",
+                   admin_menu[1], admin_menu[10], admin_menu[3],
+                   admin_menu[4], admin_menu[5], admin_menu[8])
+keyboards.register("user", "balance", user_menu[13], admin_menu[8])
+keyboards.register("user", "cart", user_menu[10], user_menu[12],
+                   admin_menu[8])
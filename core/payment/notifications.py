@@ -0,0 +1,135 @@
+"""
+Модуль приёма HTTP-уведомлений yookassa.
+
+Args:
+    YOOKASSA_NETWORKS: Адреса, с которых yookassa присылает уведомления
+
+Func:
+    is_yookassa_address: Проверка адреса отправителя уведомления
+    fulfil_payment: Зачисление успешного платежа и оповещение пользователя
+    setup_notifications: Регистрация обработчика уведомлений в приложении
+"""
+import ipaddress
+import logging
+from decimal import Decimal, InvalidOperation
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError
+from aiohttp import web
+
+from config import YOOKASSA_WEBHOOK_PATH, YOOKASSA_TRUST_FORWARDED
+from core.database.dataTools import apply_payment
+
+
+logger = logging.getLogger(__name__)
+
+# Опубликованные yookassa адреса отправки уведомлений
+YOOKASSA_NETWORKS = tuple(ipaddress.ip_network(network) for network in (
+    "185.71.76.0/27",
+    "185.71.77.0/27",
+    "77.75.153.0/25",
+    "77.75.156.11/32",
+    "77.75.156.35/32",
+    "77.75.154.128/25",
+    "2a02:5180::/32",
+))
+
+
+def is_yookassa_address(address: str | None) -> bool:
+    """
+    Проверка адреса отправителя уведомления.
+
+    Args:
+        address: IP-адрес отправителя
+
+    Returns:
+        Возвращает True, если адрес входит в сети yookassa
+    """
+    try:
+        ip = ipaddress.ip_address(address or "")
+    except ValueError:
+        return False
+    return any(ip in network for network in YOOKASSA_NETWORKS)
+
+
+def _remote_address(request: web.Request) -> str | None:
+    """
+    Адрес отправителя запроса.
+
+    Notes:
+
+        За обратным прокси берётся последний адрес из
+        X-Forwarded-For - его дописал сам прокси, более
+        ранние значения мог подставить отправитель.
+    """
+    if YOOKASSA_TRUST_FORWARDED:
+        forwarded = request.headers.get("X-Forwarded-For")
+        if forwarded:
+            return forwarded.split(",")[-1].strip()
+    return request.remote
+
+
+async def fulfil_payment(bot: Bot, payment: dict) -> str | None:
+    """
+    Зачисление успешного платежа и оповещение пользователя.
+
+    Args:
+        bot: Бот для отправки оповещения
+        payment: Объект платежа yookassa со статусом succeeded
+
+    Returns:
+        Возвращает отправленное оповещение, None если платёж
+        уже был зачислен или в нём нет данных для зачисления.
+        Ошибки базы пробрасываются, чтобы платёж обработали позже.
+    """
+    metadata = payment.get("metadata") or {}
+    try:
+        payment_id = payment["id"]
+        user_id = int(metadata["chat_id"])
+        amount = Decimal(payment["amount"]["value"])
+    except (KeyError, TypeError, ValueError, InvalidOperation):
+        logger.debug(f"Платёж без данных для зачисления {payment}")
+        return None
+
+    message = await apply_payment(
+        payment_id=payment_id, user_id=user_id,
+        purpose=metadata.get("purpose", "top_up"), amount=amount)
+    if message is not None:
+        try:
+            await bot.send_message(user_id, text=message)
+        except TelegramAPIError as ex:
+            logger.debug(f"Ошибка оповещения о платеже {ex}")
+    return message
+
+
+def setup_notifications(app: web.Application, bot: Bot) -> None:
+    """
+    Регистрация обработчика уведомлений yookassa.
+
+    Notes:
+
+        На payment.succeeded платёж зачисляется через fulfil_payment,
+        которая применяет каждый платёж ровно один раз, поэтому
+        повторные уведомления безопасны. Ошибка базы отвечает
+        кодом 500, и yookassa повторит уведомление позже.
+        Запросы не из сетей yookassa отклоняются с кодом 403.
+    """
+    async def handle(request: web.Request) -> web.Response:
+        if not is_yookassa_address(_remote_address(request)):
+            return web.Response(status=403)
+        try:
+            body = await request.json()
+        except ValueError:
+            return web.Response(status=400)
+        payment = body.get("object") or {}
+        if (body.get("event") != "payment.succeeded" or
+                payment.get("status") != "succeeded"):
+            return web.Response()
+        try:
+            await fulfil_payment(bot, payment)
+        except Exception as ex:
+            logger.debug(f"Ошибка зачисления платежа {ex}")
+            return web.Response(status=500)
+        return web.Response()
+
+    app.router.add_post(YOOKASSA_WEBHOOK_PATH, handle)
@@ -1,81 +1,265 @@
-from yookassa import Payment, Configuration
+"""
+Модуль работы с платёжной системой yookassa.
+
+Classes:
+    YooKassaError: Ошибка запроса к API yookassa
+    YooKassaClient: Асинхронный клиент API yookassa
+    PaymentInfo: Статус, сумма и метаданные платежа
+
+Func:
+    create_payment: Создание платежа
+    get_payment_info: Статус, сумма и метаданные платежа с кэшем
+"""
+import asyncio
+import json
+import logging
 import uuid
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import Any
+
+import aiohttp
+
+from config import (YOOKASSA_ACCIUNT_ID, YOOKASSA_SECRET_KEY,
+                    YOOKASSA_TIMEOUT, YOOKASSA_RETRIES)
+from core.database.cache import payment_cache
+from core.database.dataTools import fail_order, set_order_payment
+
+
+logger = logging.getLogger(__name__)
+
+# Статусы, после которых платёж больше не меняется
+TERMINAL_STATUSES = {"succeeded", "canceled"}
+
+_inflight: dict[str, asyncio.Task] = {}
+
+
+class YooKassaError(Exception):
+    """Ошибка запроса к API yookassa."""
+
+
+class YooKassaClient:
+    """
+    Асинхронный клиент API yookassa.
+
+    Notes:
+
+        Работает через один aiohttp-сеанс с пулом keep-alive
+        соединений, поэтому ожидание ответа платёжной системы
+        не блокирует цикл событий. Сетевые ошибки, таймауты и
+        ответы 202/429/5xx повторяются с экспоненциальной паузой,
+        создание платежа повторяется с тем же ключом идемпотентности,
+        так что повтор не создаст второй платёж.
+    """
+
+    API_URL = "https://api.yookassa.ru"
+    RETRY_STATUSES = {202, 429, 500, 502, 503, 504}
+
+    def __init__(self, account_id: str, secret_key: str,
+                 timeout: float, retries: int):
+        """Метод инициализации класса."""
+        self.auth = aiohttp.BasicAuth(str(account_id), str(secret_key))
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.retries = retries
+        self._session: aiohttp.ClientSession | None = None
 
-import yookassa
+    def _get_session(self) -> aiohttp.ClientSession:
+        """Общий сеанс с пулом соединений, создаётся при первом запросе."""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                base_url=self.API_URL,
+                auth=self.auth,
+                timeout=self.timeout,
+                connector=aiohttp.TCPConnector(limit=100,
+                                               keepalive_timeout=60))
+        return self._session
 
-from config import YOOKASSA_ACCIUNT_ID, YOOKASSA_SECRET_KEY
+    async def request(self, method: str, path: str,
+                      idempotence_key: str | None = None,
+                      **kwargs: Any) -> dict[str, Any]:
+        """
+        Запрос к API с повторами.
 
+        Args:
+            method: HTTP-метод
+            path: Путь запроса, например /v3/payments
+            idempotence_key: Ключ идемпотентности для POST-запросов
+            kwargs: Параметры aiohttp (json, params)
 
-Configuration.account_id = YOOKASSA_ACCIUNT_ID
-Configuration.secret_key = YOOKASSA_SECRET_KEY
+        Returns:
+            Возвращает тело ответа в виде словаря,
+            при исчерпании попыток поднимает YooKassaError
+        """
+        headers = {}
+        if idempotence_key is not None:
+            headers["Idempotence-Key"] = idempotence_key
+        error: Exception | None = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                await asyncio.sleep(min(0.5 * 2 ** (attempt - 1), 5))
+            try:
+                async with self._get_session().request(
+                        method, path, headers=headers,
+                        **kwargs) as response:
+                    text = await response.text()
+                    try:
+                        body = json.loads(text) if text else {}
+                    except ValueError:
+                        body = {"raw": text}
+                    if response.status in self.RETRY_STATUSES:
+                        error = YooKassaError(
+                            f"{response.status}: {body}")
+                        continue
+                    if response.status >= 400:
+                        raise YooKassaError(f"{response.status}: {body}")
+                    return body
+            except (aiohttp.ClientError, asyncio.TimeoutError) as ex:
+                error = ex
+                logger.debug(f"Ошибка запроса к yookassa {ex}")
+        raise YooKassaError(f"yookassa недоступна: {error}")
 
+    async def create_payment(self, payload: dict[str, Any],
+                             idempotence_key: str) -> dict[str, Any]:
+        """Создание платежа."""
+        return await self.request("POST", "/v3/payments", json=payload,
+                                  idempotence_key=idempotence_key)
 
-async def create_payment(amount: float,
+    async def get_payment(self, payment_id: str) -> dict[str, Any]:
+        """Получение платежа по ID."""
+        return await self.request("GET", f"/v3/payments/{payment_id}")
+
+    async def list_payments(self, params: dict[str, Any]) -> dict[str, Any]:
+        """
+        Получение страницы списка платежей.
+
+        Args:
+            params: Фильтры списка, например limit, created_at.gte
+                и cursor следующей страницы
+        """
+        return await self.request("GET", "/v3/payments", params=params)
+
+    async def close(self) -> None:
+        """Закрытие сеанса и соединений пула."""
+        if self._session is not None:
+            await self._session.close()
+
+
+yookassa_client = YooKassaClient(account_id=YOOKASSA_ACCIUNT_ID,
+                                 secret_key=YOOKASSA_SECRET_KEY,
+                                 timeout=YOOKASSA_TIMEOUT,
+                                 retries=YOOKASSA_RETRIES)
+
+
+async def create_payment(order_id: int,
+                         amount: Decimal | float,
                          chat_id: int,
-                         description: str) -> tuple[str, str]:
+                         description: str,
+                         purpose: str = "top_up") -> tuple[str, str]:
     """
     Создание платежа в yookassa.
 
     Args:
-        amount: Сумма
+        order_id: ID заказа, созданного create_order
+        amount: Сумма заказа
         chat_id: ID пользователя
         deescription: Описание/детали платежа
+        purpose: Назначение платежа: top_up или cart
 
     Returns:
-        Создаёт платёж в системе yookassa, возвращает
-        ссылку на транзакцию и ID платежа.
+        Создаёт платёж в системе yookassa и привязывает его
+        к заказу (статус pending) для сверки, возвращает ссылку
+        на транзакцию и ID платежа. Если платёж создать не
+        удалось, заказ закрывается и YooKassaError пробрасывается.
     """
     id_key = str(uuid.uuid4())
-    payment = Payment.create({
-        "amount": {
-            "value": amount,
-            "currency": "RUB"
-        },
-        "payment_method_data": {
-            "type": "bank_card"
-        },
-        "confirmation": {
-            "type": "redirect",
-            "return_url": "http://t.me/test_pay_apiBot"
-        },
-        "capture": True,
-        "metadata": {
-            "chat_id": chat_id
-        },
-        "description": description
-    }, id_key)
-
-    return payment.confirmation.confirmation_url, payment.id
-
-
-async def check_payment(payment_id: int) -> dict | bool:
+    try:
+        payment = await yookassa_client.create_payment({
+            "amount": {
+                "value": f"{Decimal(str(amount)):.2f}",
+                "currency": "RUB"
+            },
+            "payment_method_data": {
+                "type": "bank_card"
+            },
+            "confirmation": {
+                "type": "redirect",
+                "return_url": "http://t.me/test_pay_apiBot"
+            },
+            "capture": True,
+            "metadata": {
+                "chat_id": chat_id,
+                "purpose": purpose
+            },
+            "description": description
+        }, id_key)
+    except YooKassaError:
+        await fail_order(order_id)
+        raise
+    await set_order_payment(order_id=order_id, payment_id=payment["id"])
+
+    return payment["confirmation"]["confirmation_url"], payment["id"]
+
+
+@dataclass(frozen=True)
+class PaymentInfo:
     """
-    Проверка платежа в yookassa.
+    Статус, сумма и метаданные платежа.
 
     Args:
         payment_id: ID платежа в системе yookassa
-
-    Returns:
-        Проверяет статус платежа в системе yookassa,
-        возвращает метадату платежа если статус 'succeeded',
-        иначе False
+        status: Статус платежа
+        amount: Сумма платежа
+        metadata: Метаданные платежа (chat_id, purpose)
     """
-    payment = yookassa.Payment.find_one(payment_id=payment_id)
-    if payment.status == 'succeeded':
-        return payment.metadata
-    else:
-        return False
+
+    payment_id: str
+    status: str
+    amount: Decimal
+    metadata: dict[str, Any]
+
+    @property
+    def paid(self) -> bool:
+        """Платёж успешно завершён."""
+        return self.status == "succeeded"
 
 
-async def get_amount_payment(payment_id: int) -> float:
+async def _fetch_payment_info(payment_id: str) -> PaymentInfo:
+    """Запрос платежа в yookassa и сохранение ответа в кэше."""
+    payment = await yookassa_client.get_payment(payment_id)
+    info = PaymentInfo(payment_id=payment["id"],
+                       status=payment["status"],
+                       amount=Decimal(payment["amount"]["value"]),
+                       metadata=payment.get("metadata") or {})
+    payment_cache.put(payment_id, info,
+                      terminal=info.status in TERMINAL_STATUSES)
+    return info
+
+
+async def get_payment_info(payment_id: str) -> PaymentInfo:
     """
-    Получение суммы из платежа yookassa.
+    Получение статуса, суммы и метаданных платежа.
 
     Args:
         payment_id: ID платежа в системе yookassa
 
     Returns:
-        Проверяет сумму из платежа yookassa.
+        Возвращает PaymentInfo одним запросом к yookassa.
+
+    Notes:
+
+        Ответ кэшируется: незавершённый статус на PAYMENT_CACHE_TTL
+        секунд, succeeded и canceled - без срока, они уже не
+        изменятся. Одновременные запросы одного платежа (частые
+        нажатия "Проверить оплату") ждут один общий запрос.
     """
-    payment = yookassa.Payment.find_one(payment_id=payment_id)
-    return payment.amount.value
+    info = payment_cache.get(payment_id)
+    if info is not None:
+        return info
+    task = _inflight.get(payment_id)
+    if task is None:
+        task = asyncio.create_task(_fetch_payment_info(payment_id))
+        _inflight[payment_id] = task
+        task.add_done_callback(
+            lambda _: _inflight.pop(payment_id, None))
+    # shield: отмена одного ожидающего не отменяет запрос для остальных
+    return await asyncio.shield(task)
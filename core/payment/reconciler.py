@@ -0,0 +1,113 @@
+"""
+Модуль фоновой сверки неоплаченных заказов с yookassa.
+
+Func:
+    reconcile_payments: Один проход сверки заказов в статусе pending
+    start_reconciler: Запуск фоновой сверки
+    stop_reconciler: Остановка фоновой сверки
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta
+
+from aiogram import Bot
+
+from config import PAYMENT_RECONCILE_INTERVAL, PAYMENT_RECONCILE_WINDOW
+from core.database.dataTools import close_orders, get_pending_orders
+from core.payment.notifications import fulfil_payment
+from core.payment.payment_tools import yookassa_client
+
+
+logger = logging.getLogger(__name__)
+
+# Размер страницы списка платежей (максимум yookassa)
+RECONCILE_PAGE_SIZE = 100
+# Запас на расхождение времени создания платежа и записи заказа
+CREATED_AT_MARGIN = timedelta(minutes=5)
+
+_reconciler: asyncio.Task | None = None
+
+
+async def reconcile_payments(bot: Bot) -> int:
+    """
+    Один проход сверки заказов в статусе pending.
+
+    Args:
+        bot: Бот для оповещения пользователей о зачислении
+
+    Returns:
+        Возвращает количество зачисленных платежей.
+
+    Notes:
+
+        Вместо запроса на каждый платёж читается список платежей,
+        созданных начиная с самого старого ожидающего заказа,
+        по RECONCILE_PAGE_SIZE за запрос. Успешные платежи
+        зачисляются (повторно зачислить платёж нельзя), отменённые
+        закрывают заказ. Заказы старше PAYMENT_RECONCILE_WINDOW
+        перестают сверяться и получают статус expired.
+    """
+    pending = await get_pending_orders()
+    if not pending:
+        return 0
+    waiting = {row.payment_id for row in pending}
+    since = pending[0].date_order - CREATED_AT_MARGIN
+    params = {"limit": RECONCILE_PAGE_SIZE,
+              "created_at.gte": since.isoformat(timespec="milliseconds")
+              + "Z"}
+    applied = 0
+    canceled = []
+    while waiting:
+        page = await yookassa_client.list_payments(params)
+        for payment in page.get("items", []):
+            if payment.get("id") not in waiting:
+                continue
+            if payment.get("status") == "succeeded":
+                waiting.discard(payment["id"])
+                if await fulfil_payment(bot, payment) is not None:
+                    applied += 1
+            elif payment.get("status") == "canceled":
+                waiting.discard(payment["id"])
+                canceled.append(payment["id"])
+        if not page.get("next_cursor"):
+            break
+        params["cursor"] = page["next_cursor"]
+    await close_orders(canceled, status="canceled")
+
+    deadline = datetime.utcnow() - timedelta(seconds=PAYMENT_RECONCILE_WINDOW)
+    await close_orders([row.payment_id for row in pending
+                        if row.payment_id in waiting and
+                        row.date_order < deadline], status="expired")
+    if applied:
+        logger.info(f"Сверка платежей: зачислено {applied}")
+    return applied
+
+
+async def _reconcile_loop(bot: Bot) -> None:
+    """Сверка заказов раз в PAYMENT_RECONCILE_INTERVAL секунд."""
+    while True:
+        try:
+            await reconcile_payments(bot)
+        except Exception as ex:
+            logger.debug(f"Ошибка сверки платежей {ex}")
+        await asyncio.sleep(PAYMENT_RECONCILE_INTERVAL)
+
+
+def start_reconciler(bot: Bot) -> None:
+    """Запуск фоновой сверки, если она включена в настройках."""
+    global _reconciler
+    if PAYMENT_RECONCILE_INTERVAL <= 0:
+        return
+    if _reconciler is None or _reconciler.done():
+        _reconciler = asyncio.create_task(_reconcile_loop(bot))
+
+
+async def stop_reconciler() -> None:
+    """Остановка фоновой сверки при остановке бота."""
+    if _reconciler is None:
+        return
+    _reconciler.cancel()
+    try:
+        await _reconciler
+    except asyncio.CancelledError:
+        pass
@@ -6,6 +6,7 @@ Classes:
     TopUpAdmin: Ручное пополнение баланса пользователя
     WriteOffAdmin: Ручное списание средств с баланса пользователя
     TopUP: Пополнение баланса пользователя
+    LoadCodes: Загрузка кодов товара на склад
 """
 from aiogram.fsm.state import State, StatesGroup
 
@@ -29,3 +30,8 @@ class WriteOffAdmin(StatesGroup):
 
 class TopUpUser(StatesGroup):
     amount = State()
+
+
+class LoadCodes(StatesGroup):
+    product_id = State()
+    codes = State()
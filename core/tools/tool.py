@@ -1,5 +1,9 @@
-import random
+import secrets
 import string
+from typing import Iterable, Iterator, TypeVar
+
+
+T = TypeVar("T")
 
 
 async def generate_code(length: int = 8) -> str:
@@ -13,11 +17,11 @@ async def generate_code(length: int = 8) -> str:
     Returns:
 
         Возвращает сгенерированную строку,
-        с случайными символами
+        с символами из криптостойкого генератора secrets
     """
     characters = ("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdef"
                   "ghijklmnopqrstuvwxyz0123456789")
-    return ''.join(random.choices(characters, k=length))
+    return ''.join(secrets.choice(characters) for _ in range(length))
 
 
 async def generate_gift() -> str:
@@ -27,9 +31,51 @@ async def generate_gift() -> str:
     Returns:
 
         Возвращает сгенерированную строку,
-        с случайными символами
+        с символами из криптостойкого генератора secrets
     """
     characters = string.ascii_uppercase + string.ascii_lowercase + string.digits
-    code = ''.join(random.choice(characters) for _ in range(16))
+    code = ''.join(secrets.choice(characters) for _ in range(16))
     formatted_code = '-'.join(code[i:i+4] for i in range(0, 16, 4))
     return formatted_code
+
+
+def chunked(items: list[T], size: int) -> Iterator[list[T]]:
+    """
+    Делит список на части фиксированного размера.
+
+    Args:
+
+        items: Исходный список
+        size: Максимальный размер части
+
+    Returns:
+
+        Возвращает итератор по частям списка
+    """
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def split_text(lines: Iterable[str], limit: int = 4096) -> list[str]:
+    """
+    Собирает строки в сообщения, не превышающие лимит Telegram.
+
+    Args:
+
+        lines: Строки для отправки
+        limit: Максимальная длина одного сообщения
+
+    Returns:
+
+        Возвращает список текстов сообщений
+    """
+    messages: list[str] = []
+    current = ""
+    for line in lines:
+        if current and len(current) + len(line) + 1 > limit:
+            messages.append(current)
+            current = ""
+        current = f"{current}\n{line}" if current else line
+    if current:
+        messages.append(current)
+    return messages
@@ -0,0 +1,137 @@
+"""
+Модуль данных inline-кнопок и их маршрутизации.
+
+classes:
+    ShopCallback: Базовый класс данных inline-кнопки
+    CatalogPage: Листание карусели каталога
+    ToCart: Добавление товара в корзину
+    DeleteItem: Удаление товара из каталога
+    UnCart: Удаление товара из корзины
+    TopUpCheck: Проверка оплаты пополнения баланса
+    CartCheck: Проверка оплаты корзины
+    CallbackTable: Таблица обработчиков по префиксу данных кнопки
+"""
+import logging
+from typing import Any, Awaitable, Callable
+
+from aiogram.filters.callback_data import CallbackData, MAX_CALLBACK_LENGTH
+from aiogram.types import CallbackQuery
+
+
+logger = logging.getLogger(__name__)
+
+# Ответ на кнопку старого формата или с повреждёнными данными
+STALE_BUTTON_TEXT = "Кнопка устарела, откройте меню заново."
+
+
+class ShopCallback(CallbackData, prefix="base"):
+    """
+    Базовый класс данных inline-кнопки.
+
+    Notes:
+
+        Префикс - короткое имя кнопки и номер версии схемы
+        (cp1, ca1, ...). При изменении полей номер версии
+        увеличивается, и кнопки из старых сообщений получают
+        ответ STALE_BUTTON_TEXT вместо ошибки разбора.
+        pack() поднимает ValueError, если данные длиннее
+        64 байт, которые принимает Telegram.
+    """
+
+
+class CatalogPage(ShopCallback, prefix="cp1"):
+    """Листание карусели каталога от товара cursor."""
+
+    backward: bool
+    cursor: int
+
+
+class ToCart(ShopCallback, prefix="ca1"):
+    """Добавление товара в корзину."""
+
+    product_id: int
+
+
+class DeleteItem(ShopCallback, prefix="di1"):
+    """Удаление товара из каталога."""
+
+    product_id: int
+
+
+class UnCart(ShopCallback, prefix="uc1"):
+    """Удаление товара из корзины."""
+
+    product_id: int
+
+
+class TopUpCheck(ShopCallback, prefix="tc1"):
+    """Проверка оплаты пополнения баланса."""
+
+    payment_id: str
+
+
+class CartCheck(ShopCallback, prefix="cc1"):
+    """Проверка оплаты корзины."""
+
+    payment_id: str
+
+
+CallbackHandler = Callable[[CallbackQuery, Any], Awaitable[Any]]
+
+
+class CallbackTable:
+    """
+    Таблица обработчиков inline-кнопок по префиксу.
+
+    Notes:
+
+        Роутер регистрирует один обработчик callback_query,
+        который отрезает префикс до первого разделителя и
+        находит обработчик одним обращением к словарю. Данные
+        кнопки разбираются один раз в её класс и передаются
+        обработчику вторым аргументом, так что стоимость
+        маршрутизации не зависит от количества кнопок.
+    """
+
+    def __init__(self):
+        """Метод инициализации класса."""
+        self._routes: dict[str, tuple[type[ShopCallback],
+                                      CallbackHandler]] = {}
+        self.hits: dict[str, int] = {}
+
+    def route(self, callback_data: type[ShopCallback]
+              ) -> Callable[[CallbackHandler], CallbackHandler]:
+        """
+        Регистрация обработчика для класса данных кнопки.
+
+        params:
+            callback_data: класс данных кнопки с уникальным префиксом.
+        """
+        prefix = callback_data.__prefix__
+        if prefix in self._routes:
+            raise ValueError(f"Префикс {prefix!r} уже занят")
+        if len(prefix.encode()) >= MAX_CALLBACK_LENGTH:
+            raise ValueError(f"Префикс {prefix!r} длиннее данных кнопки")
+
+        def decorator(handler: CallbackHandler) -> CallbackHandler:
+            self._routes[prefix] = (callback_data, handler)
+            self.hits[prefix] = 0
+            return handler
+
+        return decorator
+
+    async def dispatch(self, callback: CallbackQuery) -> Any:
+        """Разбор данных кнопки и вызов её обработчика."""
+        data = callback.data or ""
+        prefix = data.split(ShopCallback.__separator__, 1)[0]
+        route = self._routes.get(prefix)
+        if route is None:
+            return await callback.answer(STALE_BUTTON_TEXT)
+        callback_data, handler = route
+        try:
+            unpacked = callback_data.unpack(data)
+        except (TypeError, ValueError) as ex:
+            logger.debug(f"Ошибка разбора данных кнопки {data!r} {ex}")
+            return await callback.answer(STALE_BUTTON_TEXT)
+        self.hits[prefix] += 1
+        return await handler(callback, unpacked)
@@ -0,0 +1,148 @@
+"""
+Модуль маршрутизации кнопок reply-меню.
+
+classes:
+    MenuRoute: Обработчик кнопки меню и условия его вызова
+    MenuTable: Таблица обработчиков по тексту кнопки
+    MenuFilter: Фильтр aiogram, находящий обработчик кнопки
+"""
+import inspect
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable
+
+from aiogram.filters import Filter
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import StatesGroup
+from aiogram.types import Message
+
+
+MenuHandler = Callable[..., Awaitable[Any]]
+
+
+@dataclass
+class MenuRoute:
+    """
+    Обработчик кнопки меню и условия его вызова.
+
+    Args:
+        handler: Обработчик сообщения
+        admin_only: Кнопка доступна только администратору
+        any_state: Кнопка срабатывает и при активном состоянии FSM
+        states: Состояния FSM, в которых кнопка тоже срабатывает
+        with_state: Обработчик принимает FSMContext
+        hits: Количество вызовов обработчика
+    """
+
+    handler: MenuHandler
+    admin_only: bool = False
+    any_state: bool = False
+    states: frozenset[str] = frozenset()
+    with_state: bool = False
+    hits: int = 0
+
+
+class MenuTable:
+    """
+    Таблица обработчиков кнопок reply-меню по тексту кнопки.
+
+    Notes:
+
+        Текст сообщения ищется в словаре одним обращением,
+        поэтому время маршрутизации не зависит от количества
+        кнопок. Регистрировать можно только тексты из словарей
+        меню, переданных при создании, опечатка в тексте кнопки
+        сразу даёт ошибку при импорте.
+    """
+
+    def __init__(self, admin_id: int, *menus: dict[int, str]):
+        """Метод инициализации класса."""
+        self.admin_id = admin_id
+        self._buttons = {text for menu in menus for text in menu.values()}
+        self._routes: dict[str, MenuRoute] = {}
+
+    def route(self, text: str, admin_only: bool = False,
+              any_state: bool = False,
+              states: tuple[type[StatesGroup], ...] = ()
+              ) -> Callable[[MenuHandler], MenuHandler]:
+        """
+        Регистрация обработчика кнопки.
+
+        params:
+            text: текст кнопки из словаря меню.
+            admin_only: кнопка только для администратора.
+            any_state: кнопка перебивает активное состояние FSM
+            (навигация по меню).
+            states: группы состояний, которые кнопка тоже перебивает
+            (обработчики этих состояний были зарегистрированы после
+            кнопки, когда кнопки были отдельными хендлерами).
+        """
+        if text not in self._buttons:
+            raise ValueError(f"Кнопки {text!r} нет в меню")
+        if text in self._routes:
+            raise ValueError(f"Кнопка {text!r} уже занята")
+
+        def decorator(handler: MenuHandler) -> MenuHandler:
+            self._routes[text] = MenuRoute(
+                handler=handler,
+                admin_only=admin_only,
+                any_state=any_state,
+                states=frozenset(name for group in states
+                                 for name in group.__all_states_names__),
+                with_state="state" in inspect.signature(handler).parameters)
+            return handler
+
+        return decorator
+
+    def resolve(self, message: Message,
+                raw_state: str | None) -> MenuRoute | None:
+        """Обработчик кнопки с учётом роли пользователя и состояния FSM."""
+        route = self._routes.get(message.text)
+        if route is None:
+            return None
+        if (raw_state is not None and not route.any_state and
+                raw_state not in route.states):
+            return None
+        if route.admin_only and message.from_user.id != self.admin_id:
+            return None
+        return route
+
+    async def dispatch(self, message: Message, state: FSMContext,
+                       route: MenuRoute) -> Any:
+        """Вызов обработчика найденной кнопки."""
+        route.hits += 1
+        if route.with_state:
+            return await route.handler(message, state)
+        return await route.handler(message)
+
+    def stats(self) -> dict[str, int]:
+        """Количество вызовов по каждой кнопке."""
+        return {text: route.hits for text, route in self._routes.items()}
+
+
+class MenuFilter(Filter):
+    """
+    Фильтр aiogram, находящий обработчик кнопки меню.
+
+    Notes:
+
+        Пропускает сообщение, только если для его текста есть
+        обработчик, доступный пользователю. При активном состоянии
+        FSM пропускаются лишь кнопки any_state и кнопки, которым
+        передано это состояние в states, остальной текст достаётся
+        обработчикам состояний. Найденный обработчик
+        передаётся дальше в аргументе menu_route.
+    """
+
+    def __init__(self, table: MenuTable):
+        """Метод инициализации класса."""
+        self.table = table
+
+    async def __call__(self, message: Message,
+                       raw_state: str | None = None) -> bool | dict:
+        """Поиск обработчика по тексту сообщения."""
+        if message.text is None:
+            return False
+        route = self.table.resolve(message, raw_state)
+        if route is None:
+            return False
+        return {"menu_route": route}
@@ -0,0 +1,173 @@
+"""
+Модуль приёма обновлений через вебхук.
+
+function:
+    concurrency_middleware: Ограничение одновременно обрабатываемых запросов
+    create_app: Сборка aiohttp-приложения с обработчиком вебхука
+    set_webhook: Регистрация вебхука в Telegram
+    serve: Запуск веб-сервера
+    run_webhook: Запуск веб-сервера и регистрация вебхука в Telegram
+    run_sharded_webhook: Приём вебхука с передачей обновлений воркерам
+    notifications_server: Веб-сервер уведомлений yookassa для режима polling
+"""
+import asyncio
+import hmac
+import logging
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable
+
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import (SimpleRequestHandler,
+                                            setup_application)
+from aiohttp import web
+
+from config import (WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_SECRET,
+                    WEBAPP_HOST, WEBAPP_PORT, WEBHOOK_MAX_CONNECTIONS,
+                    WEBHOOK_CONCURRENCY, YOOKASSA_NOTIFICATIONS)
+from core.payment.notifications import setup_notifications
+
+
+logger = logging.getLogger(__name__)
+
+
+def concurrency_middleware(limit: int) -> Callable:
+    """
+    Middleware, ограничивающее число одновременно обрабатываемых запросов.
+
+    params:
+        limit: максимум запросов в обработке, остальные ждут очереди.
+    """
+    semaphore = asyncio.Semaphore(limit)
+
+    @web.middleware
+    async def middleware(request: web.Request,
+                         handler: Callable[[web.Request],
+                                           Awaitable[web.StreamResponse]]
+                         ) -> web.StreamResponse:
+        async with semaphore:
+            return await handler(request)
+
+    return middleware
+
+
+def create_app(dp: Dispatcher, bot: Bot) -> web.Application:
+    """
+    Сборка aiohttp-приложения для приёма обновлений.
+
+    Notes:
+
+        Обновление обрабатывается в рамках HTTP-запроса
+        (handle_in_background=False, по умолчанию aiogram отвечает
+        200 сразу и обрабатывает обновление в фоне, и лимит
+        ничего бы не ограничивал), поэтому Telegram не пришлёт
+        больше WEBHOOK_MAX_CONNECTIONS обновлений сразу, а внутри
+        процесса одновременно обрабатывается не больше
+        WEBHOOK_CONCURRENCY обновлений.
+        Запросы без верного X-Telegram-Bot-Api-Secret-Token
+        отклоняются с кодом 401. При YOOKASSA_NOTIFICATIONS
+        на том же сервере принимаются уведомления yookassa.
+    """
+    app = web.Application(
+        middlewares=[concurrency_middleware(WEBHOOK_CONCURRENCY)])
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        secret_token=WEBHOOK_SECRET,
+        handle_in_background=False,
+    ).register(app, path=WEBHOOK_PATH)
+    if YOOKASSA_NOTIFICATIONS:
+        setup_notifications(app, bot)
+    setup_application(app, dp, bot=bot)
+    return app
+
+
+async def set_webhook(bot: Bot, dp: Dispatcher) -> None:
+    """Регистрация адреса вебхука в Telegram."""
+    if not (WEBHOOK_URL and WEBHOOK_SECRET):
+        raise ValueError("Для режима webhook нужны WEBHOOK_URL и "
+                         "WEBHOOK_SECRET")
+    await bot.set_webhook(
+        url=f"{WEBHOOK_URL}{WEBHOOK_PATH}",
+        secret_token=WEBHOOK_SECRET,
+        max_connections=WEBHOOK_MAX_CONNECTIONS,
+        allowed_updates=dp.resolve_used_update_types(),
+    )
+
+
+async def serve(app: web.Application) -> None:
+    """Запуск веб-сервера до отмены задачи."""
+    runner = web.AppRunner(app)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, host=WEBAPP_HOST, port=WEBAPP_PORT).start()
+        logger.info(f"Веб-сервер слушает {WEBAPP_HOST}:{WEBAPP_PORT}")
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot) -> None:
+    """
+    Запуск бота в режиме вебхука.
+
+    Notes:
+
+        Регистрирует вебхук в Telegram при старте и поднимает
+        веб-сервер. Несколько реплик за балансировщиком
+        регистрируют один и тот же адрес.
+    """
+    async def on_startup(bot: Bot) -> None:
+        await set_webhook(bot, dp)
+
+    dp.startup.register(on_startup)
+    await serve(create_app(dp, bot))
+
+
+async def run_sharded_webhook(dp: Dispatcher, bot: Bot,
+                              route: Callable[[dict], None]) -> None:
+    """
+    Приём вебхука супервизором с передачей обновлений воркерам.
+
+    params:
+        route: функция, отправляющая сырое обновление нужному воркеру.
+    """
+    async def handle(request: web.Request) -> web.Response:
+        token = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+        if not hmac.compare_digest(token, WEBHOOK_SECRET):
+            return web.Response(status=401)
+        route(await request.json())
+        return web.json_response({})
+
+    app = web.Application()
+    app.router.add_post(WEBHOOK_PATH, handle)
+    if YOOKASSA_NOTIFICATIONS:
+        setup_notifications(app, bot)
+    await set_webhook(bot, dp)
+    await serve(app)
+
+
+@asynccontextmanager
+async def notifications_server(bot: Bot) -> AsyncIterator[None]:
+    """
+    Веб-сервер уведомлений yookassa на время работы в режиме polling.
+
+    Notes:
+
+        Обновления Telegram в этом режиме приходят без HTTP,
+        поэтому сервер поднимается только при YOOKASSA_NOTIFICATIONS
+        и останавливается вместе с получением обновлений.
+    """
+    if not YOOKASSA_NOTIFICATIONS:
+        yield
+        return
+    app = web.Application()
+    setup_notifications(app, bot)
+    server = asyncio.create_task(serve(app))
+    try:
+        yield
+    finally:
+        server.cancel()
+        try:
+            await server
+        except asyncio.CancelledError:
+            pass
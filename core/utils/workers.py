@@ -0,0 +1,289 @@
+"""
+Модуль многопроцессной обработки обновлений.
+
+classes:
+    HashRing: Консистентное хеширование пользователей по воркерам
+
+function:
+    update_user_id: ID пользователя, от которого пришло обновление
+    worker_main: Точка входа процесса-воркера
+    run_supervisor: Запуск воркеров и распределение обновлений по ним
+"""
+import asyncio
+import hashlib
+import logging
+import multiprocessing
+import queue as queues_module
+import signal
+import time
+from bisect import bisect
+from collections import deque
+from typing import Any, Callable
+
+from aiogram import Bot, Dispatcher
+from aiogram.exceptions import TelegramNetworkError, TelegramServerError
+
+from config import BOT_MODE, WORKER_CONCURRENCY
+from core.database.code_pool import warm_code_pools
+from core.database.dataTools import warm_known_users
+from core.payment.payment_tools import yookassa_client
+from core.utils.webhook import notifications_server, run_sharded_webhook
+
+
+logger = logging.getLogger(__name__)
+
+# Виртуальных узлов на одного воркера: сглаживает распределение
+# и при смене числа воркеров переезжает лишь часть пользователей
+RING_REPLICAS = 100
+# Период проверки живости воркеров (сек.)
+WORKER_CHECK_INTERVAL = 1
+# Больше стольких перезапусков одного воркера за окно - супервизор
+# останавливается, а не перезапускает падающий воркер бесконечно
+WORKER_MAX_RESTARTS = 5
+WORKER_RESTART_WINDOW = 60
+
+
+class HashRing:
+    """Кольцо консистентного хеширования ID пользователей по воркерам."""
+
+    def __init__(self, nodes: int, replicas: int = RING_REPLICAS):
+        """Метод инициализации класса."""
+        points = sorted(
+            (self._hash(f"worker-{node}-{replica}"), node)
+            for node in range(nodes) for replica in range(replicas))
+        self._keys = [point for point, _ in points]
+        self._nodes = [node for _, node in points]
+
+    @staticmethod
+    def _hash(value: str) -> int:
+        """Стабильный между процессами хеш строки."""
+        return int.from_bytes(
+            hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+
+    def node_for(self, user_id: int) -> int:
+        """Номер воркера, за которым закреплён пользователь."""
+        index = bisect(self._keys, self._hash(str(user_id)))
+        return self._nodes[index % len(self._nodes)]
+
+
+def update_user_id(update: dict[str, Any]) -> int:
+    """
+    ID пользователя, от которого пришло обновление.
+
+    Returns:
+        Возвращает from.id вложенного объекта обновления,
+        для обновлений без пользователя - ID чата или 0.
+    """
+    for key, value in update.items():
+        if key == "update_id" or not isinstance(value, dict):
+            continue
+        if "from" in value:
+            return value["from"]["id"]
+        if "user" in value:
+            return value["user"]["id"]
+        if "chat" in value:
+            return value["chat"]["id"]
+    return 0
+
+
+async def _worker_loop(index: int, queue: multiprocessing.Queue,
+                       create_bot: Callable[[], Bot],
+                       create_dispatcher: Callable[[], Dispatcher]) -> None:
+    """
+    Цикл воркера: чтение обновлений из очереди и их обработка.
+
+    Notes:
+
+        Обновления одного пользователя обрабатываются строго по
+        очереди (блокировка на пользователя), разных пользователей -
+        параллельно, но не больше WORKER_CONCURRENCY одновременно.
+    """
+    bot = create_bot()
+    dp = create_dispatcher()
+    await warm_known_users()
+    await warm_code_pools()
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(WORKER_CONCURRENCY)
+    locks: dict[int, list] = {}
+    tasks: set[asyncio.Task] = set()
+
+    async def handle(update: dict[str, Any]) -> None:
+        user_id = update_user_id(update)
+        entry = locks.setdefault(user_id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0], semaphore:
+                await dp.feed_raw_update(bot, update)
+        except Exception as ex:
+            logger.debug(f"Ошибка обработки обновления воркером {index} {ex}")
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del locks[user_id]
+
+    logger.info(f"Воркер {index} запущен")
+    try:
+        while (update := await loop.run_in_executor(None, queue.get)):
+            task = asyncio.create_task(handle(update))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.wait(tasks)
+    finally:
+        await dp.storage.close()
+        await yookassa_client.close()
+        await bot.session.close()
+        logger.info(f"Воркер {index} остановлен")
+
+
+def worker_main(index: int, queue: multiprocessing.Queue,
+                create_bot: Callable[[], Bot],
+                create_dispatcher: Callable[[], Dispatcher]) -> None:
+    """
+    Точка входа процесса-воркера.
+
+    Notes:
+
+        Ctrl+C приходит всей группе процессов, поэтому воркер его
+        игнорирует и завершается по сигналу из очереди, дообработав
+        уже полученные обновления.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(_worker_loop(index, queue, create_bot, create_dispatcher))
+
+
+async def _poll(bot: Bot, dp: Dispatcher,
+                route: Callable[[dict[str, Any]], None]) -> None:
+    """Получение обновлений long polling'ом и передача их воркерам."""
+    await bot.delete_webhook(drop_pending_updates=False)
+    allowed_updates = dp.resolve_used_update_types()
+    offset = None
+    while True:
+        try:
+            updates = await bot.get_updates(offset=offset, timeout=30,
+                                            allowed_updates=allowed_updates)
+        except (TelegramNetworkError, TelegramServerError) as ex:
+            logger.debug(f"Ошибка получения обновлений {ex}")
+            await asyncio.sleep(1)
+            continue
+        for update in updates:
+            route(update.model_dump(mode="json", by_alias=True,
+                                    exclude_none=True))
+            offset = update.update_id + 1
+
+
+async def _watch_workers(
+        processes: list[multiprocessing.Process],
+        respawn: Callable[[int], multiprocessing.Process]) -> None:
+    """
+    Перезапуск завершившихся воркеров.
+
+    Notes:
+
+        Без перезапуска обновления пользователей упавшего воркера
+        (OOM, необработанная ошибка) копились бы в его очереди
+        без единой записи в логе. Воркер, упавший больше
+        WORKER_MAX_RESTARTS раз за WORKER_RESTART_WINDOW секунд,
+        останавливает супервизор ошибкой.
+    """
+    restarts = [deque() for _ in processes]
+    while True:
+        await asyncio.sleep(WORKER_CHECK_INTERVAL)
+        for index, process in enumerate(processes):
+            if process.is_alive():
+                continue
+            now = time.monotonic()
+            history = restarts[index]
+            while history and now - history[0] > WORKER_RESTART_WINDOW:
+                history.popleft()
+            if len(history) >= WORKER_MAX_RESTARTS:
+                raise RuntimeError(
+                    f"Воркер {index} падает слишком часто, "
+                    f"код выхода {process.exitcode}")
+            logger.error(f"Воркер {index} завершился с кодом "
+                         f"{process.exitcode}, перезапуск")
+            history.append(now)
+            processes[index] = respawn(index)
+
+
+async def run_supervisor(bot: Bot, dp: Dispatcher, workers: int,
+                         create_bot: Callable[[], Bot],
+                         create_dispatcher: Callable[[], Dispatcher]) -> None:
+    """
+    Запуск пула воркеров и распределение обновлений по ним.
+
+    Notes:
+
+        Супервизор принимает обновления (polling или вебхук) и
+        отправляет каждое воркеру, выбранному консистентным
+        хешем from_user.id. Так все обновления пользователя,
+        а значит и его состояние FSM, живут в одном процессе.
+        Воркеры запускаются через spawn, чтобы не наследовать
+        цикл событий и соединения пула родителя. Завершившийся
+        воркер перезапускается (_watch_workers).
+    """
+    context = multiprocessing.get_context("spawn")
+    queues = [context.Queue() for _ in range(workers)]
+
+    def spawn(index: int) -> multiprocessing.Process:
+        process = context.Process(target=worker_main,
+                                  args=(index, queues[index],
+                                        create_bot, create_dispatcher),
+                                  name=f"botshop-worker-{index}",
+                                  daemon=True)
+        process.start()
+        return process
+
+    def respawn(index: int) -> multiprocessing.Process:
+        # Воркер, убитый внутри queue.get, навсегда держит блокировку
+        # чтения очереди, поэтому новый воркер получает новую очередь,
+        # а в неё переносится всё, что удаётся забрать из старой
+        old, queues[index] = queues[index], context.Queue()
+        try:
+            while True:
+                queues[index].put(old.get_nowait())
+        except queues_module.Empty:
+            pass
+        try:
+            lost = old.qsize()
+        except NotImplementedError:
+            lost = 0
+        if lost:
+            logger.error(f"Воркер {index}: потеряно обновлений {lost}")
+        old.cancel_join_thread()
+        old.close()
+        return spawn(index)
+
+    processes = [spawn(index) for index in range(workers)]
+    ring = HashRing(workers)
+
+    def route(update: dict[str, Any]) -> None:
+        queues[ring.node_for(update_user_id(update))].put(update)
+
+    async def receive() -> None:
+        if BOT_MODE == "webhook":
+            await run_sharded_webhook(dp, bot, route)
+        else:
+            async with notifications_server(bot):
+                await _poll(bot, dp, route)
+
+    await dp.emit_startup(bot=bot)
+    tasks = [asyncio.create_task(receive()),
+             asyncio.create_task(_watch_workers(processes, respawn))]
+    try:
+        done, _ = await asyncio.wait(tasks,
+                                     return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            task.result()
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for queue in queues:
+            queue.put(None)
+        loop = asyncio.get_running_loop()
+        for process in processes:
+            await loop.run_in_executor(None, process.join, 10)
+            if process.is_alive():
+                process.terminate()
+        await dp.emit_shutdown(bot=bot)
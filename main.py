@@ -5,9 +5,15 @@ from aiogram import Bot, Dispatcher
 from aiogram.client.bot import DefaultBotProperties
 from aiogram.fsm.storage.memory import MemoryStorage
 
-from config import TOKEN
+from config import (TOKEN, BOT_MODE, FSM_STORAGE, FSM_STATE_TTL,
+                    FSM_FLUSH_INTERVAL, WORKERS)
 from core.handlers.handler import router, start_bot, stop_bot
-from core.database.dataTools import create_tables, delete_tables
+from core.database.code_pool import warm_code_pools
+from core.database.dataTools import delete_tables, warm_known_users
+from core.database.migrations import apply_migrations
+from core.database.storage import PostgresStorage
+from core.utils.webhook import notifications_server, run_webhook
+from core.utils.workers import run_supervisor
 
 
 logging.basicConfig(
@@ -19,30 +25,69 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-async def start() -> None:
+def create_bot() -> Bot:
+    """Создание экземпляра бота."""
+    return Bot(token=TOKEN,
+               default=DefaultBotProperties(parse_mode='HTML'))
+
+
+def create_dispatcher() -> Dispatcher:
     """
-    Функция инициации и запуска бота.
+    Создание диспетчера с хранилищем состояний и роутерами.
 
     Notes:
 
-        Входная точка в проект с настройками
-        и регистрацией роутеров.
+        Используется и основным процессом, и воркерами,
+        поэтому функции старта и остановки бота здесь
+        не регистрируются. Пользователь закреплён за процессом,
+        кроме режима webhook без воркеров: там реплик может быть
+        несколько, и состояние читается из базы.
     """
-    bot = Bot(token=TOKEN,
-              default=DefaultBotProperties(parse_mode='HTML'))
-    storage = MemoryStorage()
+    if FSM_STORAGE == "postgres":
+        storage = PostgresStorage(
+            ttl=FSM_STATE_TTL, flush_interval=FSM_FLUSH_INTERVAL,
+            pinned=WORKERS > 0 or BOT_MODE != "webhook")
+    else:
+        storage = MemoryStorage()
     dp = Dispatcher(storage=storage)
 
     # Регистрация роутера
     dp.include_router(router=router)
+    return dp
+
+
+async def start() -> None:
+    """
+    Функция инициации и запуска бота.
+
+    Notes:
+
+        Входная точка в проект с настройками
+        и регистрацией роутеров. При WORKERS > 0 процесс
+        становится супервизором и раздаёт обновления воркерам.
+    """
+    bot = create_bot()
+    dp = create_dispatcher()
 
     # Регистрация функций для старта и остановки
     dp.startup.register(start_bot)
     dp.shutdown.register(stop_bot)
 
     try:
-        await create_tables()
-        await dp.start_polling(bot, skip_updates=False)
+        await apply_migrations()
+        if WORKERS > 0:
+            await run_supervisor(bot, dp, WORKERS,
+                                 create_bot, create_dispatcher)
+        elif BOT_MODE == "webhook":
+            await warm_known_users()
+            await warm_code_pools()
+            await run_webhook(dp, bot)
+        else:
+            await warm_known_users()
+            await warm_code_pools()
+            await bot.delete_webhook(drop_pending_updates=False)
+            async with notifications_server(bot):
+                await dp.start_polling(bot, skip_updates=False)
     except Exception as ex:
         logger.debug(f"Ошибка приложения {ex}")
     finally:
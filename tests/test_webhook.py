@@ -0,0 +1,65 @@
+"""Проверка ограничения одновременной обработки обновлений вебхука."""
+import asyncio
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Message
+from aiohttp.test_utils import TestClient, TestServer
+
+from core.utils import webhook
+
+
+SECRET = "test-secret"
+
+
+def _update(update_id: int) -> dict:
+    """Минимальное текстовое обновление Telegram."""
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": update_id, "type": "private"},
+            "from": {"id": update_id, "is_bot": False, "first_name": "u"},
+            "text": "hello",
+        },
+    }
+
+
+async def _run_updates(count: int) -> tuple[int, list[int]]:
+    """Отправка count обновлений сразу, возвращает пик параллельности."""
+    dp = Dispatcher()
+    running = 0
+    peak = 0
+
+    @dp.message()
+    async def handler(message: Message) -> None:
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.05)
+        running -= 1
+
+    bot = Bot(token="42:TEST")
+    client = TestClient(TestServer(webhook.create_app(dp, bot)))
+    await client.start_server()
+    try:
+        responses = await asyncio.gather(*(
+            client.post(webhook.WEBHOOK_PATH, json=_update(index),
+                        headers={"X-Telegram-Bot-Api-Secret-Token": SECRET})
+            for index in range(1, count + 1)))
+        statuses = [response.status for response in responses]
+    finally:
+        await client.close()
+        await bot.session.close()
+    return peak, statuses
+
+
+def test_handlers_do_not_overlap_with_concurrency_one(monkeypatch):
+    monkeypatch.setattr(webhook, "WEBHOOK_CONCURRENCY", 1)
+    monkeypatch.setattr(webhook, "WEBHOOK_SECRET", SECRET)
+    monkeypatch.setattr(webhook, "YOOKASSA_NOTIFICATIONS", False)
+
+    peak, statuses = asyncio.run(_run_updates(5))
+
+    assert statuses == [200] * 5
+    assert peak == 1